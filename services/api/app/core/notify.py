@@ -0,0 +1,38 @@
+from sqlalchemy import text
+from app.core.settings import settings
+
+# Channel the worker LISTENs on. Payload is "<schema>.<table>" of the raw
+# table that received rows. Postgres delivers NOTIFY on commit (and drops
+# duplicates within one transaction), so a rolled-back ingest wakes no one.
+INGEST_CHANNEL = "raw_ingest"
+# Payload is the schema that queued a background analysis job
+JOBS_CHANNEL = "analysis_jobs"
+# Payload is the schema whose tables/columns changed (bootstrap, dbt run);
+# workers drop their cached catalog for it.
+SCHEMA_CHANNEL = "schema_changed"
+
+
+async def notify_ingest(db, schema: str, table: str):
+    """Queues an ingest notification on the current transaction; call before commit."""
+    if not settings.INGEST_NOTIFY_ENABLED:
+        return
+    await db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": INGEST_CHANNEL, "payload": f"{schema}.{table}"},
+    )
+
+
+async def notify_job_queued(db, schema: str):
+    """Queues an analysis_jobs notification on the current transaction; call before commit."""
+    await db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": JOBS_CHANNEL, "payload": schema},
+    )
+
+
+async def notify_schema_changed(db, schema: str):
+    """Queues a schema_changed notification on the current transaction; call before commit."""
+    await db.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": SCHEMA_CHANNEL, "payload": schema},
+    )
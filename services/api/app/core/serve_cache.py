@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+
+import asyncpg
+
+from app.core.notify import SCHEMA_CHANNEL
+from app.core.settings import settings
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger("serve-cache")
+
+# Serialized serve responses keyed by (schema, generation, brand_id, query
+# variant), bounded by entry count and total body bytes. A schema_changed
+# notification bumps the schema's generation, which makes every cached
+# response of that tenant unreachable; they then age out of the LRU.
+_RESPONSES = TTLCache(
+    settings.SERVE_CACHE_MAX_ENTRIES,
+    settings.SERVE_CACHE_TTL_SECONDS,
+    max_bytes=settings.SERVE_CACHE_MAX_BYTES,
+    sizeof=lambda cached: len(cached[1]),
+)
+_GENERATIONS = {}  # schema -> number of schema_changed notifications seen by this process
+
+# Shards whose LISTEN failed are not retried before this many seconds
+LISTEN_RETRY_SECONDS = 30
+
+
+def response_key(schema: str, brand_id: str, *variant) -> tuple:
+    return (schema, _GENERATIONS.get(schema, 0), brand_id, *variant)
+
+
+def get_response(key: tuple):
+    return _RESPONSES.get(key)
+
+
+def set_response(key: tuple, value):
+    _RESPONSES.set(key, value)
+
+
+def invalidate_tenant_responses(schema: str):
+    """Drops every cached serve response of a tenant (after a dbt run)."""
+    _GENERATIONS[schema] = _GENERATIONS.get(schema, 0) + 1
+
+
+class SchemaChangeListener:
+    """
+    Holds one LISTEN schema_changed connection per shard that served a
+    request, so every API process drops a tenant's cached responses when
+    bootstrap, /transform/run or any dbt run (the project's on-run-end hook)
+    sends a notification for it. Responses are only cached while their
+    shard is listened on; a dropped connection may have lost notifications,
+    so it empties the cache.
+    """
+
+    def __init__(self):
+        self._conns = {}  # shard key -> asyncpg connection
+        self._failed = {}  # shard key -> monotonic time of the last failed connect
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _shard_key(cfg: dict) -> str:
+        return cfg.get("shard_id") or f"{cfg['host']}:{cfg['port']}:{cfg['db_name']}"
+
+    def _on_notify(self, conn, pid, channel, payload):
+        invalidate_tenant_responses(payload)
+
+    def _on_terminate(self, key):
+        def callback(conn):
+            if self._conns.get(key) is not conn:
+                return  # closed on purpose by close()
+            logger.warning(f"LISTEN connection to shard {key} closed; dropping cached serve responses")
+            del self._conns[key]
+            _RESPONSES.clear()
+        return callback
+
+    async def ensure(self, cfg: dict) -> bool:
+        """Returns whether cached responses of tenants on this shard can be trusted."""
+        key = self._shard_key(cfg)
+        if key in self._conns:
+            return True
+        if time.monotonic() - self._failed.get(key, float("-inf")) < LISTEN_RETRY_SECONDS:
+            return False
+        async with self._lock:
+            if key in self._conns:
+                return True
+            try:
+                conn = await asyncpg.connect(
+                    host=cfg["host"], port=cfg["port"], database=cfg["db_name"],
+                    user=cfg["user"], password=cfg["password"],
+                )
+                await conn.add_listener(SCHEMA_CHANNEL, self._on_notify)
+                conn.add_termination_listener(self._on_terminate(key))
+            except Exception:
+                logger.exception(f"Failed to LISTEN on shard {key}; serve responses are not cached")
+                self._failed[key] = time.monotonic()
+                return False
+            self._conns[key] = conn
+            logger.info(f"Listening on {SCHEMA_CHANNEL} for shard {key}")
+            return True
+
+    async def close(self):
+        conns, self._conns = self._conns, {}
+        for conn in conns.values():
+            await conn.close()
+
+
+schema_listener = SchemaChangeListener()
@@ -19,6 +19,34 @@ class Settings(BaseSettings):
 
     API_KEY: str | None = None
     ALLOWED_DOMAINS: list[str] = ["social", "web", "crm", "ads"]
+    # Upper bound on records accepted by a single /ingest/{domain}/batch call
+    INGEST_BATCH_MAX_RECORDS: int = 10000
+    # Streaming NDJSON ingest: rows per flush, flushes per commit, max line size
+    INGEST_STREAM_CHUNK_SIZE: int = 1000
+    INGEST_STREAM_COMMIT_EVERY: int = 5
+    INGEST_STREAM_MAX_LINE_BYTES: int = 8 * 1024 * 1024
+    # Per-process LRU of recently ingested payload hashes (fast-path dedupe)
+    INGEST_DEDUP_CACHE_SIZE: int = 100_000
+    # NOTIFY raw_ingest on commit so workers wake for the tenant immediately
+    INGEST_NOTIFY_ENABLED: bool = True
+
+    # Serve API: accounts page size (default / max) and the per-process
+    # response cache, dropped for a tenant on its schema_changed NOTIFY and
+    # bounded by entries and total response bytes
+    SERVE_PAGE_SIZE: int = 1000
+    SERVE_MAX_PAGE_SIZE: int = 5000
+    SERVE_CACHE_TTL_SECONDS: int = 300
+    SERVE_CACHE_MAX_ENTRIES: int = 5000
+    SERVE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Resolved tenant config / table names / session factories
+    TENANT_CACHE_TTL_SECONDS: int = 300
+    TENANT_CACHE_MAX_ENTRIES: int = 1000
+    # Per-shard pool sizing: ceil(tenants * per_tenant) clamped to [min, max];
+    # max_overflow is twice the pool size
+    TENANT_POOL_MIN_SIZE: int = 10
+    TENANT_POOL_MAX_SIZE: int = 40
+    TENANT_POOL_CONNECTIONS_PER_TENANT: float = 0.5
     # Absolute defaults so uvicorn can be started from any path
     DBT_PROJECT_DIR: str = str(BASE_DIR / "services/dbt")
     # DBT_BIN: str = str(BASE_DIR / "venv-dbt/bin/dbt")
@@ -31,6 +59,18 @@ class Settings(BaseSettings):
     AZURE_OPENAI_CHAT_DEPLOYMENT: str = "gpt-5.2-chat"
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT: str = "text-embedding-3-large"
     AZURE_OPENAI_API_VERSION: str = "2024-12-01-preview"
+    # Shared budget for the two concurrent /analysis/summarize completions
+    ANALYSIS_SUMMARY_TIMEOUT_SECONDS: float = 180.0
+    # HNSW candidate list size for /analysis/search (recall vs latency;
+    # also the most rows a filtered search can return)
+    ANALYSIS_SEARCH_EF_SEARCH: int = 100
+    # Embedding cache (in-process LRU + master-DB tier shared with the
+    # worker) and batching of concurrent misses into one embeddings call
+    EMBEDDING_CACHE_SIZE: int = 2000
+    EMBEDDING_CACHE_DB_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_INPUTS: int = 2048
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100000
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
 
     class Config:
         env_file = ".env"
@@ -1,6 +1,9 @@
 import logging
+import math
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from app.core.settings import settings
+from app.core.vector import install_vector_codec
 
 logger = logging.getLogger("tenant-db")
 
@@ -12,21 +15,42 @@ def make_url(cfg):
         f"@{cfg['host']}:{cfg['port']}/{cfg['db_name']}"
     )
 
+def pool_key(cfg):
+    # One pool per shard; configs without a shard id (scripts) key by address.
+    return cfg.get("shard_id") or f"{cfg['host']}:{cfg['port']}:{cfg['db_name']}"
+
+def pool_size_for(tenant_count):
+    # Grow the pool with the number of tenants routed to the shard, within bounds.
+    if not tenant_count:
+        return settings.TENANT_POOL_MIN_SIZE
+    wanted = math.ceil(tenant_count * settings.TENANT_POOL_CONNECTIONS_PER_TENANT)
+    return max(settings.TENANT_POOL_MIN_SIZE, min(settings.TENANT_POOL_MAX_SIZE, wanted))
+
 def get_engine(cfg):
-    key = f"{cfg['host']}:{cfg['port']}:{cfg['db_name']}"
+    key = pool_key(cfg)
     if key not in _POOLS:
-        logger.info("Creating pool", extra={"db": key})
+        pool_size = pool_size_for(cfg.get("tenant_count"))
+        logger.info("Creating pool", extra={"db": key, "pool_size": pool_size})
         _POOLS[key] = create_async_engine(
             make_url(cfg),
-            pool_size=10,
-            max_overflow=20,
+            pool_size=pool_size,
+            max_overflow=pool_size * 2,
             pool_pre_ping=True
         )
+        install_vector_codec(_POOLS[key])
     return _POOLS[key]
 
-async def get_tenant_session(cfg):
+_SESSION_FACTORIES = {}
+
+def get_session_factory(cfg):
     engine = get_engine(cfg)
-    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    key = pool_key(cfg)
+    if key not in _SESSION_FACTORIES:
+        _SESSION_FACTORIES[key] = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    return _SESSION_FACTORIES[key]
+
+async def get_tenant_session(cfg):
+    Session = get_session_factory(cfg)
 
     async with Session() as session:
         try:
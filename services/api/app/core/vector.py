@@ -0,0 +1,63 @@
+import logging
+import struct
+
+import numpy as np
+from sqlalchemy import event
+
+# Kept identical in services/api and services/worker apart from the logger
+# name; services/api/tests/test_shared_copies.py fails if they drift.
+logger = logging.getLogger("vector-codec")
+
+# pgvector binary wire format (vector_send/vector_recv): int16 dim, int16
+# unused, then dim big-endian float4. Binding a float32 array sends 4 bytes
+# per dimension (~12 KB for 3072 dims) instead of ~60 KB of decimal text the
+# server has to parse again.
+_HEADER = struct.Struct(">HH")
+_WIRE_DTYPE = np.dtype(">f4")
+
+# Schema pgvector was installed into (CREATE EXTENSION runs with the
+# bootstrapping tenant's search_path, so it is not always public)
+_TYPE_SCHEMA_SQL = """
+    SELECT n.nspname
+    FROM pg_catalog.pg_type t
+    JOIN pg_catalog.pg_namespace n ON n.oid = t.typnamespace
+    WHERE t.typname = 'vector'
+    LIMIT 1
+"""
+
+
+def to_vector(values) -> np.ndarray | None:
+    """Embedding (list of floats) as the float32 array bound for VECTOR columns."""
+    if values is None or len(values) == 0:
+        return None
+    return np.asarray(values, dtype=np.float32)
+
+
+def _encode(values) -> bytes:
+    arr = np.asarray(values, dtype=_WIRE_DTYPE)
+    if arr.ndim != 1:
+        raise ValueError(f"expected a 1-dimensional vector, got shape {arr.shape}")
+    return _HEADER.pack(arr.shape[0], 0) + arr.tobytes()
+
+
+def _decode(data: bytes) -> np.ndarray:
+    dim, _ = _HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=_WIRE_DTYPE, count=dim, offset=_HEADER.size).astype(np.float32)
+
+
+async def register_vector(conn):
+    """Registers the binary vector codec on an asyncpg connection (no-op without pgvector)."""
+    schema = await conn.fetchval(_TYPE_SCHEMA_SQL)
+    if schema is None:
+        logger.warning("pgvector type not found; vector codec not registered")
+        return
+    await conn.set_type_codec(
+        "vector", schema=schema, encoder=_encode, decoder=_decode, format="binary"
+    )
+
+
+def install_vector_codec(engine):
+    """Registers the codec on every new connection of an async engine's pool."""
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.run_async(register_vector)
@@ -5,6 +5,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from app.core.settings import settings
+from app.core.serve_cache import schema_listener
 from app.routes import schema, ingest, serve, transform, analysis
 
 def setup_logging():
@@ -56,6 +57,7 @@ async def startup():
 
 @app.on_event("shutdown")
 async def shutdown():
+    await schema_listener.close()
     logger.info("API stopped")
 
 @app.get("/health")
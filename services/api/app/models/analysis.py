@@ -1,5 +1,16 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Union
 
 class SummarizeRequest(BaseModel):
     payload: Union[Dict[str, Any], List[Any]] = Field(..., description="Input JSON content to summarize associated with social media data.")
+    stream: bool = Field(False, description="Stream summary text and the final result as NDJSON events.")
+    background: bool = Field(False, description="Queue the request for the worker and return a job id immediately.")
+
+
+class SearchRequest(BaseModel):
+    query: str = Field(..., min_length=1, description="Text to search stored summaries for.")
+    k: int = Field(10, ge=1, le=100, description="Number of results.")
+    created_after: Optional[datetime] = Field(None, description="Only rows created at or after this time.")
+    created_before: Optional[datetime] = Field(None, description="Only rows created before this time.")
+    types: Optional[List[str]] = Field(None, description="Only rows whose payload type is one of these (e.g. global_daily, analysis).")
@@ -1,17 +1,25 @@
+import asyncio
 import json
 import logging
+import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy import text
 from openai import AsyncAzureOpenAI
 import openai
 
-from app.core.db import get_db
+from app.core.analysis_prompts import SUMMARY_MAX_COMPLETION_TOKENS, SUMMARY_PROMPTS, summary_messages
+from app.core.db import SessionLocal
+from app.core.embedding_cache import EmbeddingCache
+from app.core.notify import notify_job_queued
 from app.core.settings import settings
-from app.models.analysis import SummarizeRequest
+from app.core.tenant_store import resolve_tenant
+from app.core.vector import to_vector
+from app.models.analysis import SearchRequest, SummarizeRequest
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -24,134 +32,393 @@ client = AsyncAzureOpenAI(
     azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
 )
 
-async def generate_summary(content: str, prompt_instruction: str) -> str:
-    """Helper to generate summary using Chat Completion"""
+async def generate_summary(content: str, prompt_instruction: str, on_delta=None) -> str:
+    """
+    Helper to generate summary using Chat Completion. With `on_delta` the
+    completion is streamed and each text fragment is passed to it as it arrives.
+    """
+    messages = summary_messages(content, prompt_instruction)
     try:
-        response = await client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a helpful assistant.",
-                },
-                {
-                    "role": "user",
-                    "content": f"{prompt_instruction}\n\nInput Data:\n{content}",
-                }
-            ],
-            max_completion_tokens=16384,
-            model=settings.AZURE_OPENAI_CHAT_DEPLOYMENT
+        if on_delta is None:
+            response = await client.chat.completions.create(
+                messages=messages,
+                max_completion_tokens=SUMMARY_MAX_COMPLETION_TOKENS,
+                model=settings.AZURE_OPENAI_CHAT_DEPLOYMENT
+            )
+            return response.choices[0].message.content
+
+        parts = []
+        stream = await client.chat.completions.create(
+            messages=messages,
+            max_completion_tokens=SUMMARY_MAX_COMPLETION_TOKENS,
+            model=settings.AZURE_OPENAI_CHAT_DEPLOYMENT,
+            stream=True,
         )
-        return response.choices[0].message.content
+        async for chunk in stream:
+            # Azure sends a leading chunk with prompt filter results and no choices
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            parts.append(chunk.choices[0].delta.content)
+            await on_delta(chunk.choices[0].delta.content)
+        return "".join(parts)
     except Exception as e:
         logger.error(f"Error generating summary: {e}")
         raise HTTPException(status_code=500, detail=f"LLM generation failed: {str(e)}")
 
-async def generate_embedding(text_content: str) -> List[float]:
-    """Helper to generate embedding"""
+async def _create_embeddings(texts: List[str]) -> List[List[float]]:
+    response = await client.embeddings.create(
+        input=texts,
+        model=settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT
+    )
+    return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+# Repeated search queries and texts are embedded once; concurrent misses
+# are batched into one embeddings call
+embedding_cache = EmbeddingCache(
+    model=settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT,
+    create=_create_embeddings,
+    session_factory=SessionLocal,
+    memory_size=settings.EMBEDDING_CACHE_SIZE,
+    db_enabled=settings.EMBEDDING_CACHE_DB_ENABLED,
+    max_inputs=settings.EMBEDDING_BATCH_MAX_INPUTS,
+    max_tokens=settings.EMBEDDING_BATCH_MAX_TOKENS,
+    batch_window_seconds=settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+)
+
+async def generate_embedding(text_content: str):
+    """Helper to generate embedding (float32 array, via the embedding cache)"""
     try:
-        response = await client.embeddings.create(
-            input=[text_content],
-            model=settings.AZURE_OPENAI_EMBEDDING_DEPLOYMENT
-        )
-        # response.data[0].embedding
-        return response.data[0].embedding
+        return (await embedding_cache.embed([text_content]))[0]
     except Exception as e:
         logger.error(f"Error generating embedding: {e}")
         raise HTTPException(status_code=500, detail=f"Embedding generation failed: {str(e)}")
 
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+async def generate_summaries(payload_str: str, timings: dict, on_delta=None) -> list[str]:
+    """
+    Runs both summaries concurrently under one ANALYSIS_SUMMARY_TIMEOUT_SECONDS
+    budget. If either fails or the budget runs out, the other is cancelled.
+    `on_delta(index, text)` receives streamed fragments of summary `index`.
+    """
+    async def run(index: int, instruction: str) -> str:
+        started = time.perf_counter()
+        forward = (lambda delta: on_delta(index, delta)) if on_delta else None
+        summary = await generate_summary(payload_str, instruction, on_delta=forward)
+        timings[f"summary_{index}_ms"] = _ms(started)
+        return summary
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(run(i, p)) for i, p in enumerate(SUMMARY_PROMPTS, 1)]
+    try:
+        async with asyncio.timeout(settings.ANALYSIS_SUMMARY_TIMEOUT_SECONDS):
+            return await asyncio.gather(*tasks)
+    except TimeoutError:
+        raise HTTPException(504, f"Summary generation timed out after {settings.ANALYSIS_SUMMARY_TIMEOUT_SECONDS}s")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        timings["summaries_ms"] = _ms(started)
+
+
+async def embed_and_store(tenant, summaries: list[str], timings: dict) -> dict:
+    """Combines the summaries with date/time, embeds them and stores the row in post_embeddings."""
+    summary_1, summary_2 = summaries
+
+    # 3. Combine Summaries
+    current_time_str = datetime.now().isoformat()
+    combined_text = (
+        f"Date: {current_time_str}\n\n"
+        f"Summary 1:\n{summary_1}\n\n"
+        f"Summary 2:\n{summary_2}\n\n"
+        f"Original Content Context: Summary of input."
+    )
+
+    # 4. Generate Embedding for Combined Text
+    started = time.perf_counter()
+    embedding_vector = await generate_embedding(combined_text)
+    timings["embedding_ms"] = _ms(started)
+    payload_json = json.dumps(
+        {
+            "combined_text": combined_text,
+            "type": "analysis",
+        }
+    )
+    # 5. Store in Database
+    post_id = str(uuid.uuid4())
+
+    sql = f"""
+    INSERT INTO {tenant.table("post_embeddings")} (post_id, embedding, payload, created_at)
+    VALUES (:post_id, :embedding, CAST(:payload AS jsonb), NOW())
+    """
+
+    started = time.perf_counter()
+    async for db in tenant.session():
+        try:
+            await db.execute(
+                text(sql),
+                {
+                    "post_id": post_id,
+                    "embedding": to_vector(embedding_vector),  # binary pgvector codec
+                    "payload": payload_json
+                }
+            )
+            await db.commit()
+        except Exception as inner_e:
+            await db.rollback()
+            logger.error(f"DB Insert failed: {inner_e}")
+            raise HTTPException(500, f"Database insertion failed: {str(inner_e)}")
+    timings["db_ms"] = _ms(started)
+
+    return {
+        "status": "ok",
+        "post_id": post_id,
+        "created_at": current_time_str
+    }
+
+
+async def _stream_summarize(tenant, payload_str: str):
+    """
+    NDJSON event stream for `stream: true`: "delta" events carry summary text
+    as it is generated, followed by one "done" event with the stored result
+    or an "error" event.
+    """
+    started = time.perf_counter()
+    timings = {}
+    events = asyncio.Queue()
+
+    async def on_delta(index: int, delta: str):
+        await events.put({"event": "delta", "summary": index, "text": delta})
+
+    async def pipeline():
+        try:
+            summaries = await generate_summaries(payload_str, timings, on_delta=on_delta)
+            result = await embed_and_store(tenant, summaries, timings)
+            timings["total_ms"] = _ms(started)
+            await events.put({"event": "done", **result, "timings": timings})
+        except HTTPException as e:
+            await events.put({"event": "error", "status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.exception("Analysis failed")
+            await events.put({"event": "error", "status_code": 500, "detail": str(e)})
+
+    task = asyncio.create_task(pipeline())
+    try:
+        while True:
+            event = await events.get()
+            yield json.dumps(event) + "\n"
+            if event["event"] in ("done", "error"):
+                break
+    finally:
+        # Client went away: stop generating
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+JOBS_TABLE = "analysis_jobs"
+
+
+async def enqueue_job(tenant, payload_str: str) -> dict:
+    """
+    Stores the serialized payload in analysis_jobs and wakes a worker; the
+    job runs there on exactly the text the sync path would send.
+    """
+    job_id = str(uuid.uuid4())
+    async for db in tenant.session():
+        try:
+            res = await db.execute(
+                text(f"""
+                    INSERT INTO {tenant.table(JOBS_TABLE)} (job_id, status, payload)
+                    VALUES (CAST(:job_id AS uuid), 'queued', :payload)
+                    RETURNING created_at
+                """),
+                {"job_id": job_id, "payload": payload_str},
+            )
+            created_at = res.scalar_one()
+            await notify_job_queued(db, tenant.schema)
+            await db.commit()
+        except Exception as inner_e:
+            await db.rollback()
+            logger.error(f"Job enqueue failed: {inner_e}")
+            raise HTTPException(500, f"Job enqueue failed: {str(inner_e)}")
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "created_at": created_at.isoformat(),
+        "status_url": f"/analysis/jobs/{job_id}",
+    }
+
+
 @router.post("/summarize")
 async def summarize_and_store(
     req: SummarizeRequest,
     x_tenant_id: str = Header(..., description="Tenant ID"),
-    master_db=Depends(get_db)
 ):
     """
-    Takes JSON input, generates two summaries, combines them with date/time,
-    creates an embedding, and stores it in post_embeddings in the tenant's schema.
+    Takes JSON input, generates two summaries concurrently, combines them with
+    date/time, creates an embedding, and stores it in post_embeddings in the
+    tenant's schema. Returns per-stage timings; with `stream: true` responds
+    with an NDJSON event stream instead. With `background: true` the request
+    is queued for the worker and a job id is returned immediately (202).
     """
+    started = time.perf_counter()
+    timings = {}
     try:
         # Resolve Tenant
-        from app.core.tenant_store import get_tenant_db
-        from app.core.tenant_schema import qualified_table, tenant_schema_name
-        from app.core.tenant_db import get_tenant_session
-
         try:
-            cfg = await get_tenant_db(master_db, x_tenant_id)
-            schema = tenant_schema_name(x_tenant_id)
-            table_name = qualified_table(schema, "post_embeddings")
+            tenant = await resolve_tenant(x_tenant_id)
         except Exception:
             raise HTTPException(401, "Invalid tenant")
 
         # 1. Prepare Input
         # Serialize payload to string for LLM
         payload_str = json.dumps(req.payload, default=str)
-        
+
+        if req.background:
+            return JSONResponse(status_code=202, content=await enqueue_job(tenant, payload_str))
+
+        if req.stream:
+            return StreamingResponse(_stream_summarize(tenant, payload_str), media_type="application/x-ndjson")
+
         # 2. Generate Summaries
-        # First Summary: Broad summary
-        summary_1 = await generate_summary(
-            payload_str, 
-            "Create a detailed summary info of all the social media handle details provided for the company. The summary should have every detail especially in terms of nos and overall context, it should capture every possible information which will be important for executives of that company."
-        )
-        
-        # Second Summary: "summarize the json output" (interpreted as structure/highlights)
-        summary_2 = await generate_summary(
-            payload_str, 
-            "Summarize the provided JSON output data structure and content highlights. Capture the numbers,scores, issues, recommendations, etc whichever is important and relevant for the company to know and grow. IT should have every detailed information about each KPIs. The summary should be very detailed and should capture every possible information which will be important for executives of that company."
-        )
-        
-        # 3. Combine Summaries
-        current_time_str = datetime.now().isoformat()
-        combined_text = (
-            f"Date: {current_time_str}\n\n"
-            f"Summary 1:\n{summary_1}\n\n"
-            f"Summary 2:\n{summary_2}\n\n"
-            f"Original Content Context: Summary of input."
-        )
-        
-        # 4. Generate Embedding for Combined Text
-        embedding_vector = await generate_embedding(combined_text)
-        payload_json = json.dumps(
-            {
-                "combined_text": combined_text
-            }
-        )
-        # 5. Store in Database
-        post_id = str(uuid.uuid4())
-        
-        # We need to format vector for SQL. 
-        # For pgvector with sqlalchemy/asyncpg, passing a list often works if the driver supports it, 
-        # OR we pass a string representation '[x,y,z]'.
-        embedding_str = f"[{','.join(map(str, embedding_vector))}]"
-        
-        sql = f"""
-        INSERT INTO {table_name} (post_id, embedding, payload, created_at)
-        VALUES (:post_id, :embedding, CAST(:payload AS jsonb), NOW())
-        """
-        
-        async for db in get_tenant_session(cfg):
-            try:
-                await db.execute(
-                    text(sql),
-                    {
-                        "post_id": post_id,
-                        "embedding": embedding_str, 
-                        "payload": payload_json
-                    }
-                )
-                await db.commit()
-            except Exception as inner_e:
-                await db.rollback()
-                logger.error(f"DB Insert failed: {inner_e}")
-                raise HTTPException(500, f"Database insertion failed: {str(inner_e)}")
-        
-        return {
-            "status": "ok", 
-            "post_id": post_id,
-            "created_at": current_time_str
-        }
-    
+        summaries = await generate_summaries(payload_str, timings)
+
+        result = await embed_and_store(tenant, summaries, timings)
+        timings["total_ms"] = _ms(started)
+        return {**result, "timings": timings}
+
     except HTTPException:
         raise
     except Exception as e:
         logger.exception("Analysis failed")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(
+    job_id: uuid.UUID,
+    x_tenant_id: str = Header(..., description="Tenant ID"),
+):
+    """Status of a background summarize job, with its result once it has succeeded."""
+    try:
+        tenant = await resolve_tenant(x_tenant_id)
+    except Exception:
+        raise HTTPException(401, "Invalid tenant")
+
+    async for db in tenant.session():
+        res = await db.execute(
+            text(f"""
+                SELECT job_id, status, result, error, attempts, created_at, started_at, finished_at
+                FROM {tenant.table(JOBS_TABLE)}
+                WHERE job_id = CAST(:job_id AS uuid)
+            """),
+            {"job_id": str(job_id)},
+        )
+        row = res.fetchone()
+    if row is None:
+        raise HTTPException(404, "Job not found")
+
+    return {
+        "job_id": str(row.job_id),
+        "status": row.status,
+        "attempts": row.attempts,
+        "created_at": row.created_at.isoformat(),
+        "started_at": row.started_at.isoformat() if row.started_at else None,
+        "finished_at": row.finished_at.isoformat() if row.finished_at else None,
+        "result": row.result,
+        "error": row.error,
+    }
+
+
+# post_embeddings.embedding is VECTOR(3072); the HNSW index is built on its
+# halfvec cast (see bootstrap.sql) and the ORDER BY must match it exactly.
+EMBEDDING_DIM = 3072
+_DISTANCE = f"(embedding::halfvec({EMBEDDING_DIM}) <=> CAST(CAST(:query AS vector) AS halfvec({EMBEDDING_DIM})))"
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # created_at is TIMESTAMP (written by now() on a UTC server)
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@router.post("/search")
+async def search_embeddings(
+    req: SearchRequest,
+    x_tenant_id: str = Header(..., description="Tenant ID"),
+):
+    """
+    Embeds the query and returns the k stored summaries closest to it by
+    cosine similarity (HNSW index), optionally filtered by creation time and
+    payload type. Filters are applied to the index candidates
+    (ANALYSIS_SEARCH_EF_SEARCH of them), so a very selective filter can
+    return fewer than k rows.
+    """
+    started = time.perf_counter()
+    timings = {}
+    try:
+        tenant = await resolve_tenant(x_tenant_id)
+    except Exception:
+        raise HTTPException(401, "Invalid tenant")
+
+    step = time.perf_counter()
+    query_vector = await generate_embedding(req.query)
+    timings["embedding_ms"] = _ms(step)
+
+    where = ["embedding IS NOT NULL"]
+    params = {"query": to_vector(query_vector), "k": req.k}
+    if req.created_after:
+        where.append("created_at >= :created_after")
+        params["created_after"] = _naive_utc(req.created_after)
+    if req.created_before:
+        where.append("created_at < :created_before")
+        params["created_before"] = _naive_utc(req.created_before)
+    if req.types:
+        where.append("payload->>'type' = ANY(CAST(:types AS text[]))")
+        params["types"] = req.types
+
+    sql = f"""
+        SELECT post_id, created_at, payload, 1 - {_DISTANCE} AS score
+        FROM {tenant.table("post_embeddings")}
+        WHERE {" AND ".join(where)}
+        ORDER BY {_DISTANCE}
+        LIMIT :k
+    """
+
+    step = time.perf_counter()
+    async for db in tenant.session():
+        try:
+            # Transaction-local, so pooled connections keep the default
+            await db.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef, true)"),
+                {"ef": str(max(settings.ANALYSIS_SEARCH_EF_SEARCH, req.k))},
+            )
+            res = await db.execute(text(sql), params)
+            rows = res.fetchall()
+            await db.commit()
+        except Exception as inner_e:
+            await db.rollback()
+            logger.error(f"Vector search failed: {inner_e}")
+            raise HTTPException(500, f"Vector search failed: {str(inner_e)}")
+    timings["query_ms"] = _ms(step)
+    timings["total_ms"] = _ms(started)
+
+    return {
+        "status": "ok",
+        "count": len(rows),
+        "results": [
+            {
+                "post_id": row.post_id,
+                "score": round(float(row.score), 6),
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "type": row.payload.get("type") if isinstance(row.payload, dict) else None,
+                "payload": row.payload,
+            }
+            for row in rows
+        ],
+        "timings": timings,
+    }
@@ -1,55 +1,467 @@
-import json
-from fastapi import APIRouter, Header, Depends, HTTPException
+import logging
+import time
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from pydantic import ValidationError
 from sqlalchemy import text
 
 from app.models.ingest import IngestRequest
-from app.core.db import get_db
-from app.core.tenant_schema import qualified_table, tenant_schema_name
-from app.core.tenant_store import get_tenant_db
-from app.core.tenant_db import get_tenant_session
-from app.utils.hash import hash_payload
+from app.core.settings import settings
+from app.core.notify import notify_ingest
+from app.core.tenant_store import TenantContext, resolve_tenant
+from app.utils.dedup import RecentHashCache
+from app.utils.hash import canonical_json, hash_bytes, loads
+from app.utils.ttl_cache import TTLCache
 
 router = APIRouter()
+logger = logging.getLogger("ingest")
+
+# Keys are (schema, brand_id, domain, payload_hash) of rows known to be stored
+recent_hashes = RecentHashCache(settings.INGEST_DEDUP_CACHE_SIZE)
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+# Raw tables a stream can be written into. The raw_social_* / account tables
+# have no brand_id/domain/hash columns, so they get a narrower insert.
+STREAM_TARGETS = ("raw_events", "raw_social_posts", "raw_social_interactions", "raw_account_metrics")
+MAX_REPORTED_ERRORS = 100
+
+# schema -> whether raw_events has uq_raw_events_payload. Schemas bootstrapped
+# before the index existed get it when /schema/bootstrap is re-run; until
+# then their inserts dedupe with NOT EXISTS instead of ON CONFLICT. A missing
+# index is rechecked sooner so the switch happens shortly after the re-run.
+payload_index = TTLCache(10000, 3600)
+PAYLOAD_INDEX_RECHECK_SECONDS = 60
+
+
+def _insert_social_sql(table_name: str, target: str) -> str:
+    if target == "raw_social_interactions":
+        return f"""
+        INSERT INTO {table_name} (platform, raw_json)
+        VALUES (:platform, CAST(:payload AS jsonb))
+        """
+    return f"""
+    INSERT INTO {table_name} (platform, brand, raw_json)
+    VALUES (:platform, :brand_id, CAST(:payload AS jsonb))
+    """
+
+
+def _insert_events_sql(raw_events_table: str, unique_index: bool = True) -> str:
+    # One statement for any number of rows: columns are sent as parallel arrays
+    # and unnested server-side. Rows whose (brand_id, domain, payload_hash)
+    # already exist are skipped; RETURNING tells us which ones were new.
+    # Without the unique index the check is a best-effort NOT EXISTS probe
+    # (concurrent requests can still both insert the same payload).
+    if unique_index:
+        select, dedupe = "SELECT", "ON CONFLICT (brand_id, domain, payload_hash) DO NOTHING"
+    else:
+        select = "SELECT DISTINCT ON (t.brand_id, t.domain, t.hash)"
+        dedupe = f"""WHERE NOT EXISTS (
+        SELECT 1 FROM {raw_events_table} e
+        WHERE e.brand_id = t.brand_id AND e.domain = t.domain AND e.payload_hash = t.hash
+    )"""
+    return f"""
+    INSERT INTO {raw_events_table}
+    (brand_id, domain, platform, raw_json, schema_version, payload_hash)
+    {select} t.brand_id, t.domain, t.platform, CAST(t.payload AS jsonb), t.schema_version, t.hash
+    FROM unnest(
+        CAST(:brand_id AS text[]),
+        CAST(:domain AS text[]),
+        CAST(:platform AS text[]),
+        CAST(:payload AS text[]),
+        CAST(:schema_version AS text[]),
+        CAST(:hash AS text[])
+    ) AS t(brand_id, domain, platform, payload, schema_version, hash)
+    {dedupe}
+    RETURNING brand_id, payload_hash
+    """
+
+
+async def _has_payload_index(db, schema: str) -> bool:
+    known = payload_index.get(schema)
+    if known is None:
+        res = await db.execute(text("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_indexes
+                WHERE schemaname = :schema AND indexname = 'uq_raw_events_payload'
+            )
+        """), {"schema": schema})
+        known = bool(res.scalar())
+        if known:
+            payload_index.set(schema, True)
+        else:
+            logger.warning(f"{schema}.raw_events has no uq_raw_events_payload index; re-run /schema/bootstrap")
+            payload_index.set(schema, False, PAYLOAD_INDEX_RECHECK_SECONDS)
+    return known
+
+
+async def _insert_events(db, schema: str, raw_events_table: str, rows: list[dict]) -> set:
+    """Inserts rows into raw_events in one round-trip; returns the (brand_id, hash) keys that were new."""
+    columns = {
+        col: [r[col] for r in rows]
+        for col in ("brand_id", "domain", "platform", "payload", "schema_version", "hash")
+    }
+    sql = _insert_events_sql(raw_events_table, await _has_payload_index(db, schema))
+    res = await db.execute(text(sql), columns)
+    return {(r.brand_id, r.payload_hash) for r in res}
+
+
+def _row_params(domain, brand_id, platform, schema_version, payload_bytes: bytes) -> dict:
+    return {
+        "brand_id": brand_id,
+        "domain": domain,
+        "platform": platform,
+        "payload": payload_bytes.decode(),
+        "schema_version": schema_version,
+        "hash": hash_bytes(payload_bytes),
+    }
+
+
+def _event_params(domain: str, req: IngestRequest) -> dict:
+    # Serialize JSON ONCE, deterministically; the hash is taken over the same bytes
+    return _row_params(domain, req.brand_id, req.platform, req.schema_version, canonical_json(req.payload))
+
+
+def _parse_batch_body(body: bytes, content_type: str) -> list:
+    """Decode a batch body as either a JSON array or NDJSON (one object per line)."""
+    if content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES:
+        items = []
+        for line in body.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(loads(line))
+            except ValueError as e:
+                items.append(e)
+        return items
+
+    try:
+        items = loads(body)
+    except ValueError:
+        raise HTTPException(400, "Batch body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(400, "Batch body must be a JSON array or NDJSON")
+    return items
+
+
+async def _iter_ndjson_lines(stream, max_line_bytes: int):
+    """
+    Yields complete lines from an async byte stream without buffering more
+    than one partial line. Lines longer than max_line_bytes yield a ValueError
+    in their place and are discarded. Each chunk is scanned once: a line
+    spanning many chunks is kept as a list of pieces and joined when it ends.
+    """
+    parts, size, oversized = [], 0, False
+    async for chunk in stream:
+        start = 0
+        while (end := chunk.find(b"\n", start)) != -1:
+            piece = chunk[start:end]
+            if oversized or size + len(piece) > max_line_bytes:
+                yield ValueError(f"Line exceeds {max_line_bytes} bytes")
+            else:
+                line = b"".join(parts) + piece if parts else piece
+                if line.strip():
+                    yield line
+            parts, size, oversized = [], 0, False
+            start = end + 1
+        rest = chunk[start:]
+        if rest and not oversized:
+            if size + len(rest) > max_line_bytes:
+                # Drop what was buffered; the rest of the line is skipped
+                parts, size, oversized = [], 0, True
+            else:
+                parts.append(rest)
+                size += len(rest)
+    if oversized:
+        yield ValueError(f"Line exceeds {max_line_bytes} bytes")
+    elif parts:
+        line = b"".join(parts)
+        if line.strip():
+            yield line
+
+
+async def _ingest_one(tenant: TenantContext, raw_events_table: str, row: dict) -> dict:
+    key = (tenant.schema, row["brand_id"], row["domain"], row["hash"])
+    if key in recent_hashes:
+        return {"status": "duplicate", "payload_hash": row["hash"]}
+
+    async for db in tenant.session():
+        try:
+            inserted = await _insert_events(db, tenant.schema, raw_events_table, [row])
+            if inserted:
+                await notify_ingest(db, tenant.schema, "raw_events")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise HTTPException(500, "Ingestion failed")
+
+    recent_hashes.add(key)
+    return {"status": "ingested" if inserted else "duplicate", "payload_hash": row["hash"]}
+
 
 @router.post("/{domain}")
 async def ingest(
     domain: str,
     req: IngestRequest,
     x_tenant_id: str = Header(...),
-    master_db=Depends(get_db)
 ):
     try:
-        cfg = await get_tenant_db(master_db, x_tenant_id)
-        raw_events_table = qualified_table(tenant_schema_name(x_tenant_id), "raw_events")
+        tenant = await resolve_tenant(x_tenant_id)
+        raw_events_table = tenant.table("raw_events")
     except Exception:
         raise HTTPException(401, "Invalid tenant")
 
-    sql = f"""
-    INSERT INTO {raw_events_table}
-    (brand_id, domain, platform, raw_json, schema_version, payload_hash)
-    VALUES
-    (:brand_id, :domain, :platform, CAST(:payload AS jsonb), :schema_version, :hash)
+    try:
+        row = _event_params(domain, req)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return await _ingest_one(tenant, raw_events_table, row)
+
+
+@router.post("/{domain}/raw")
+async def ingest_raw(
+    domain: str,
+    request: Request,
+    brand_id: str = Query(..., description="Brand or tenant identifier"),
+    platform: str | None = Query(None, description="facebook, instagram, twitter, etc"),
+    schema_version: str = Query("v1"),
+    x_tenant_id: str = Header(...),
+):
+    """
+    Ingests one payload sent as the raw request body, with the envelope
+    fields as query parameters. The body is decoded and canonicalized in a
+    single pass without building a pydantic model, which is the dominant
+    cost for large payloads.
+    """
+    try:
+        tenant = await resolve_tenant(x_tenant_id)
+        raw_events_table = tenant.table("raw_events")
+    except Exception:
+        raise HTTPException(401, "Invalid tenant")
+
+    try:
+        payload = loads(await request.body())
+    except ValueError:
+        raise HTTPException(400, "Body must be a JSON object")
+    if not isinstance(payload, dict):
+        raise HTTPException(400, "Body must be a JSON object")
+
+    try:
+        row = _row_params(domain, brand_id, platform, schema_version, canonical_json(payload))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return await _ingest_one(tenant, raw_events_table, row)
+
+
+@router.post("/{domain}/batch")
+async def ingest_batch(
+    domain: str,
+    request: Request,
+    x_tenant_id: str = Header(...),
+):
+    """
+    Ingests many events in one call. The body is either a JSON array of
+    IngestRequest objects or NDJSON (Content-Type: application/x-ndjson).
+    Valid records are written with a single insert in one transaction;
+    each record is reported as ingested, duplicate or rejected by index.
     """
+    started = time.perf_counter()
 
-    # Serialize JSON ONCE, deterministically
-    payload_str = json.dumps(req.payload, sort_keys=True)
+    try:
+        tenant = await resolve_tenant(x_tenant_id)
+        raw_events_table = tenant.table("raw_events")
+    except Exception:
+        raise HTTPException(401, "Invalid tenant")
 
-    async for db in get_tenant_session(cfg):
+    items = _parse_batch_body(await request.body(), request.headers.get("content-type", ""))
+    if len(items) > settings.INGEST_BATCH_MAX_RECORDS:
+        raise HTTPException(
+            413,
+            f"Batch too large: {len(items)} records (max {settings.INGEST_BATCH_MAX_RECORDS})"
+        )
+
+    results = []
+    pending = {}  # (brand_id, hash) -> (row, result) for records that need a DB write
+    for i, item in enumerate(items):
+        if isinstance(item, Exception):
+            results.append({"index": i, "status": "rejected", "error": f"Invalid JSON: {item}"})
+            continue
         try:
-            await db.execute(
-                text(sql),
-                {
-                    "brand_id": req.brand_id,
-                    "domain": domain,
-                    "platform": req.platform,
-                    "payload": payload_str,
-                    "schema_version": req.schema_version,
-                    "hash": hash_payload(payload_str),
-                },
-            )
-            await db.commit()
+            req = IngestRequest.model_validate(item)
+        except ValidationError as e:
+            results.append({"index": i, "status": "rejected", "error": e.errors(include_url=False, include_context=False)})
+            continue
+        try:
+            row = _event_params(domain, req)
+        except ValueError as e:
+            results.append({"index": i, "status": "rejected", "error": str(e)})
+            continue
+        key = (row["brand_id"], row["hash"])
+        result = {"index": i, "status": "ingested", "payload_hash": row["hash"]}
+        results.append(result)
+        if key in pending or (tenant.schema, row["brand_id"], domain, row["hash"]) in recent_hashes:
+            result["status"] = "duplicate"
+            continue
+        pending[key] = (row, result)
+
+    if pending:
+        async for db in tenant.session():
+            try:
+                inserted = await _insert_events(db, tenant.schema, raw_events_table, [row for row, _ in pending.values()])
+                if inserted:
+                    await notify_ingest(db, tenant.schema, "raw_events")
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                raise HTTPException(500, "Ingestion failed")
+
+        for key, (_, result) in pending.items():
+            if key not in inserted:
+                result["status"] = "duplicate"
+        recent_hashes.update((tenant.schema, brand_id, domain, h) for brand_id, h in pending)
+
+    counts = {"ingested": 0, "duplicate": 0, "rejected": 0}
+    for result in results:
+        counts[result["status"]] += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        "status": "ingested" if counts["rejected"] == 0 else "partial",
+        "received": len(items),
+        "ingested": counts["ingested"],
+        "duplicates": counts["duplicate"],
+        "rejected": counts["rejected"],
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "records_per_sec": round(len(items) / elapsed, 1) if elapsed > 0 else None,
+        "results": results,
+    }
+
+
+@router.post("/{domain}/stream")
+async def ingest_stream(
+    domain: str,
+    request: Request,
+    target: str = Query("raw_events", description="Raw table to write into"),
+    chunk_size: int | None = Query(None, ge=1, description="Rows per flush"),
+    commit_every: int | None = Query(None, ge=1, description="Flushed chunks per commit"),
+    x_tenant_id: str = Header(...),
+):
+    """
+    Streams an NDJSON body of IngestRequest objects into a raw table. Lines are
+    validated and hashed as they arrive and flushed in bounded chunks, so memory
+    stays flat regardless of upload size. Reading pauses while a chunk is
+    written, which propagates backpressure to the client. Chunks already
+    committed survive a later failure; the error reports how far it got.
+    raw_events targets are deduplicated on payload hash like the other
+    ingest endpoints.
+    """
+    started = time.perf_counter()
+
+    if target not in STREAM_TARGETS:
+        raise HTTPException(400, f"Unsupported target '{target}'")
+    chunk_size = min(chunk_size or settings.INGEST_STREAM_CHUNK_SIZE, settings.INGEST_BATCH_MAX_RECORDS)
+    commit_every = commit_every or settings.INGEST_STREAM_COMMIT_EVERY
+    dedupe = target == "raw_events"
+
+    try:
+        tenant = await resolve_tenant(x_tenant_id)
+        table_name = tenant.table(target)
+    except Exception:
+        raise HTTPException(401, "Invalid tenant")
+
+    received = committed = chunks = rejected = duplicates = 0
+    errors = []
+    rows = {}  # (brand_id, hash) -> row; dedupes within the current chunk
+    pending_count = 0
+    pending_keys = []  # cache keys flushed but not yet committed
+
+    def reject(line_no, error):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_no, "error": error})
+
+    async def flush(db):
+        nonlocal chunks, duplicates, pending_count
+        if dedupe:
+            inserted = await _insert_events(db, tenant.schema, table_name, list(rows.values()))
+            duplicates += len(rows) - len(inserted)
+            pending_count += len(inserted)
+            pending_keys.extend((tenant.schema, brand_id, domain, h) for brand_id, h in rows)
+        else:
+            await db.execute(text(_insert_social_sql(table_name, target)), list(rows.values()))
+            pending_count += len(rows)
+        chunks += 1
+        rows.clear()
+
+    async def commit(db):
+        nonlocal committed, pending_count
+        if pending_count:
+            await notify_ingest(db, tenant.schema, target)
+        await db.commit()
+        committed += pending_count
+        pending_count = 0
+        recent_hashes.update(pending_keys)
+        pending_keys.clear()
+
+    async for db in tenant.session():
+        try:
+            async for line in _iter_ndjson_lines(request.stream(), settings.INGEST_STREAM_MAX_LINE_BYTES):
+                received += 1
+                if isinstance(line, Exception):
+                    reject(received, str(line))
+                    continue
+                try:
+                    req = IngestRequest.model_validate_json(line)
+                except ValidationError as e:
+                    reject(received, e.errors(include_url=False, include_context=False))
+                    continue
+                if not dedupe and not req.platform:
+                    reject(received, f"platform is required for {target}")
+                    continue
+
+                try:
+                    row = _event_params(domain, req)
+                except ValueError as e:
+                    reject(received, str(e))
+                    continue
+                key = (row["brand_id"], row["hash"]) if dedupe else received
+                if dedupe and (key in rows or (tenant.schema, row["brand_id"], domain, row["hash"]) in recent_hashes):
+                    duplicates += 1
+                    continue
+                rows[key] = row
+
+                if len(rows) >= chunk_size:
+                    await flush(db)
+                    if chunks % commit_every == 0:
+                        await commit(db)
+
+            if rows:
+                await flush(db)
+            await commit(db)
         except Exception:
             await db.rollback()
-            raise HTTPException(500, "Ingestion failed")
+            logger.exception("Streaming ingest failed")
+            raise HTTPException(
+                status_code=500,
+                detail={
+                    "message": "Ingestion failed",
+                    "received": received,
+                    "committed": committed,
+                    "rejected": rejected,
+                },
+            )
 
-    return {"status": "ingested"}
+    elapsed = time.perf_counter() - started
+    return {
+        "status": "ingested" if rejected == 0 else "partial",
+        "target": target,
+        "received": received,
+        "ingested": committed,
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "chunks": chunks,
+        "elapsed_ms": round(elapsed * 1000, 2),
+        "records_per_sec": round(received / elapsed, 1) if elapsed > 0 else None,
+        "errors": errors,
+    }
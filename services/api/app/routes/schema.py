@@ -1,12 +1,10 @@
-from fastapi import APIRouter, Header, Depends, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 from sqlalchemy import text
 import logging
 
 from app.core.settings import settings, BASE_DIR
-from app.core.db import get_db
-from app.core.tenant_schema import tenant_schema_name
-from app.core.tenant_store import get_tenant_db
-from app.core.tenant_db import get_tenant_session
+from app.core.notify import notify_schema_changed
+from app.core.tenant_store import resolve_tenant
 from app.models.schema import SchemaBootstrapRequest
 
 router = APIRouter()
@@ -17,7 +15,6 @@ logger = logging.getLogger("schema-bootstrap")
 async def bootstrap(
     req: SchemaBootstrapRequest | None = None,
     x_tenant_id: str | None = Header(None),
-    master_db=Depends(get_db)
 ):
     tenant_id = req.tenant_id if req else x_tenant_id
     if not tenant_id:
@@ -27,9 +24,15 @@ async def bootstrap(
     # Resolve tenant config
     # -------------------------
     try:
-        tenant_schema = tenant_schema_name(tenant_id)
-        # Use master_db to check if the schema exists
-        res = await master_db.execute(
+        tenant = await resolve_tenant(tenant_id)
+        tenant_schema = tenant.schema
+    except Exception as e:
+        logger.exception("Tenant resolution failed")
+        raise HTTPException(status_code=401, detail="Invalid tenant")
+
+    # The schema lives on the tenant's shard, which may not be the master DB
+    async for db in tenant.session():
+        res = await db.execute(
             text("SELECT schema_name FROM information_schema.schemata WHERE schema_name = :schema"),
             {"schema": tenant_schema}
         )
@@ -38,20 +41,11 @@ async def bootstrap(
                 status_code=404,
                 detail=f"Schema for tenant {tenant_id} does not exist."
             )
-        
-        # In this new architecture, we use the same connection info as master_db
-        # But we still use get_tenant_db to stay compatible with existing patterns
-        cfg = await get_tenant_db(master_db, tenant_id)
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.exception("Tenant resolution failed")
-        raise HTTPException(status_code=401, detail="Invalid tenant")
 
     # -------------------------
     # Execute bootstrap safely
     # -------------------------
-    async for db in get_tenant_session(cfg):
+    async for db in tenant.session():
         try:
             sql_path = BASE_DIR / "services/api/sql/bootstrap.sql"
             with open(sql_path, "r") as f:
@@ -65,6 +59,7 @@ async def bootstrap(
                 logger.info("Executing schema step")
                 await db.execute(text(stmt))
 
+            await notify_schema_changed(db, tenant_schema)
             await db.commit()
             logger.info("Tenant schema bootstrap complete")
 
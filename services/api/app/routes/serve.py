@@ -1,30 +1,129 @@
-from fastapi import APIRouter, Header, Depends, HTTPException
+import base64
+import binascii
+import hashlib
+import json
+from datetime import date, datetime
+from urllib.parse import quote
+
+from fastapi import APIRouter, Header, HTTPException, Query, Response
 from sqlalchemy import text
 
-from app.core.db import get_db
-from app.core.tenant_schema import qualified_table, tenant_schema_name
-from app.core.tenant_store import get_tenant_db
-from app.core.tenant_db import get_tenant_session
+from app.core.serve_cache import get_response, response_key, schema_listener, set_response
+from app.core.settings import settings
+from app.core.tenant_store import resolve_tenant
 
 router = APIRouter()
 
+# Columns of the dim_account mart that may be requested with ?fields=
+ACCOUNT_FIELDS = (
+    "account_id", "brand_id", "platform", "name", "username",
+    "category", "followers", "website", "rating", "last_updated",
+)
+DEFAULT_ACCOUNT_FIELDS = ("name", "followers", "rating", "last_updated")
+
+
+def _parse_fields(fields: str | None) -> tuple[str, ...]:
+    if not fields:
+        return DEFAULT_ACCOUNT_FIELDS
+    selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in selected if f not in ACCOUNT_FIELDS]
+    if unknown or not selected:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(ACCOUNT_FIELDS)}")
+    return selected
+
+
+def _encode_cursor(account_id: str) -> str:
+    return base64.urlsafe_b64encode(account_id.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise HTTPException(400, "Invalid cursor")
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
 @router.get("/brands/{brand_id}/accounts")
 @router.get("/serve/brands/{brand_id}/accounts")
 async def get_accounts(
     brand_id: str,
     x_tenant_id: str = Header(...),
-    master_db=Depends(get_db)
+    fields: str | None = Query(None, description="Comma-separated dim_account columns to return"),
+    limit: int | None = Query(None, ge=1, description="Page size (default SERVE_PAGE_SIZE)"),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    if_none_match: str | None = Header(None),
 ):
+    """
+    Accounts of a brand, ordered by account_id and paginated by keyset: when
+    more rows exist the response carries X-Next-Cursor (and a Link
+    rel="next") to pass back as ?cursor=. Responses are cached per
+    tenant+brand until a schema_changed notification (dbt run, bootstrap)
+    and carry an ETag; a matching If-None-Match on a cached response gets
+    304 without touching Postgres.
+    """
     try:
-        cfg = await get_tenant_db(master_db, x_tenant_id)
-        dim_account_table = qualified_table(tenant_schema_name(x_tenant_id), "dim_account")
+        tenant = await resolve_tenant(x_tenant_id)
+        dim_account_table = tenant.table("dim_account")
     except Exception:
         raise HTTPException(401, "Invalid tenant")
 
-    async for db in get_tenant_session(cfg):
-        res = await db.execute(text(f"""
-        SELECT name, followers, rating, last_updated
-        FROM {dim_account_table}
-        WHERE brand_id = :brand_id
-        """), {"brand_id": brand_id})
-        return [dict(r._mapping) for r in res]
+    selected = _parse_fields(fields)
+    limit = min(limit or settings.SERVE_PAGE_SIZE, settings.SERVE_MAX_PAGE_SIZE)
+    after = _decode_cursor(cursor) if cursor else None
+
+    # Without a live LISTEN on the tenant's shard a dbt run could go unnoticed
+    cacheable = await schema_listener.ensure(tenant.cfg)
+    key = response_key(tenant.schema, brand_id, selected, limit, after)
+    cached = get_response(key) if cacheable else None
+    if cached is None:
+        # account_id is the keyset (unique, indexed with brand_id by
+        # bootstrap.sql); fetch one extra row to detect a next page
+        columns = ", ".join(dict.fromkeys(selected + ("account_id",)))
+        where = "brand_id = :brand_id" + (" AND account_id > :after" if after is not None else "")
+        params = {"brand_id": brand_id, "limit": limit + 1}
+        if after is not None:
+            params["after"] = after
+
+        async for db in tenant.session():
+            res = await db.execute(text(f"""
+            SELECT {columns}
+            FROM {dim_account_table}
+            WHERE {where}
+            ORDER BY account_id
+            LIMIT :limit
+            """), params)
+            rows = res.fetchall()
+
+        next_cursor = _encode_cursor(rows[limit - 1].account_id) if len(rows) > limit else None
+        body = json.dumps(
+            [{f: getattr(r, f) for f in selected} for r in rows[:limit]],
+            default=_json_default, separators=(",", ":"),
+        ).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        cached = (etag, body, next_cursor)
+        if cacheable:
+            set_response(key, cached)
+
+    etag, body, next_cursor = cached
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        query = f"cursor={next_cursor}&limit={limit}" + (f"&fields={','.join(selected)}" if fields else "")
+        headers["Link"] = f'</serve/brands/{quote(brand_id, safe="")}/accounts?{query}>; rel="next"'
+
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,17 +1,19 @@
 import asyncio
 import json
+import logging
 import os
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException
 
-from app.core.db import get_db
 from app.core.settings import settings
-from app.core.tenant_schema import tenant_schema_name
-from app.core.tenant_store import get_tenant_db
+from app.core.notify import notify_schema_changed
+from app.core.serve_cache import invalidate_tenant_responses
+from app.core.tenant_store import resolve_tenant
 from app.models.transform import TransformRequest
 
 router = APIRouter()
+logger = logging.getLogger("transform")
 
 
 def _tail(text: str, size: int = 2000) -> str:
@@ -21,13 +23,13 @@ def _tail(text: str, size: int = 2000) -> str:
 
 
 @router.post("/run")
-async def run_transform(req: TransformRequest, master_db=Depends(get_db)):
+async def run_transform(req: TransformRequest):
     # -------------------------
     # 1️⃣ Validate tenant
     # -------------------------
     try:
-        await get_tenant_db(master_db, req.tenant_id)
-        tenant_schema = tenant_schema_name(req.tenant_id)
+        tenant = await resolve_tenant(req.tenant_id)
+        tenant_schema = tenant.schema
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid tenant")
 
@@ -87,6 +89,9 @@ async def run_transform(req: TransformRequest, master_db=Depends(get_db)):
     stdout = stdout_b.decode(errors="ignore")
     stderr = stderr_b.decode(errors="ignore")
 
+    # Marts may have changed even if a later model failed
+    invalidate_tenant_responses(tenant_schema)
+
     # -------------------------
     # 6️⃣ Handle failure
     # -------------------------
@@ -103,6 +108,14 @@ async def run_transform(req: TransformRequest, master_db=Depends(get_db)):
             },
         )
 
+    # dbt may have created or altered models; workers re-read the catalog
+    try:
+        async for db in tenant.session():
+            await notify_schema_changed(db, tenant_schema)
+            await db.commit()
+    except Exception:
+        logger.exception("Failed to notify schema change")
+
     # -------------------------
     # 7️⃣ Success response
     # -------------------------
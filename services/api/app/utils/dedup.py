@@ -0,0 +1,35 @@
+from collections import OrderedDict
+
+
+class RecentHashCache:
+    """
+    Bounded LRU of payload keys this process has recently written.
+
+    Lets ingest short-circuit obvious connector retries before they reach
+    Postgres. It is only a fast path: the unique index on raw_events remains
+    the source of truth, so a miss here (another API process, eviction) is
+    still caught by ON CONFLICT DO NOTHING.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        if key in self._keys:
+            self._keys.move_to_end(key)
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        if len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+    def update(self, keys):
+        for key in keys:
+            self.add(key)
@@ -1,7 +1,31 @@
 import hashlib
-import json
+
+import orjson
+
+
+def canonical_json(payload) -> bytes:
+    """
+    Serializes payload exactly once into canonical JSON bytes (sorted keys,
+    compact separators, UTF-8). The same bytes are hashed and sent to Postgres.
+
+    The hash is the ingest idempotency key, so there is a single encoder and
+    no fallback: another encoder's float and escape formatting (e.g. 1e+16
+    vs 1e16) would hash the same payload differently. Raises ValueError for
+    what orjson cannot encode (non-str keys, integers beyond 64 bits).
+    """
+    try:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+    except orjson.JSONEncodeError as e:
+        raise ValueError(f"Payload cannot be canonicalized: {e}") from e
+
+
+def loads(data: bytes | str):
+    return orjson.loads(data)
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
 
 def hash_payload(payload):
-    return hashlib.sha256(
-        json.dumps(payload, sort_keys=True).encode()
-    ).hexdigest()
+    return hash_bytes(canonical_json(payload))
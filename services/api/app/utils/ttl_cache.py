@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Small in-process cache with per-entry expiry and LRU eviction once
+    max_size entries (or, with sizeof, max_bytes) are exceeded. Not
+    thread-safe; meant for use from the event loop.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float, max_bytes: int | None = None, sizeof=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof  # value -> size in bytes, counted against max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _drop(self, key):
+        self.bytes -= self._entries.pop(key)[2]
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl_seconds: float | None = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        size = self.sizeof(value) if self.sizeof else 0
+        if key in self._entries:
+            self._drop(key)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict everything else and still not fit
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_size or (self.max_bytes is not None and self.bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def pop(self, key, default=None):
+        if key not in self._entries:
+            return default
+        value = self._entries[key][1]
+        self._drop(key)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,77 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import timeit
+
+# Ensure we can import 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.models.ingest import IngestRequest
+from app.utils.hash import canonical_json, hash_bytes, loads
+
+SAMPLE_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "../../../samples/facebook_payload.json")
+)
+
+
+def load_request_body(scale: int) -> bytes:
+    with open(SAMPLE_PATH) as f:
+        sample = json.load(f)
+    payload = sample["payload"]
+    if scale > 1:
+        posts = payload.get("posts", {}).get("data", [])
+        payload["posts"]["data"] = posts * scale
+    return json.dumps({
+        "brand_id": sample["brand_id"],
+        "platform": sample["platform"],
+        "payload": payload,
+    }).encode()
+
+
+def legacy_path(body: bytes):
+    # Pre-change hot path: dumps, then hash_payload dumped the string again
+    req = IngestRequest.model_validate_json(body)
+    payload_str = json.dumps(req.payload, sort_keys=True)
+    digest = hashlib.sha256(json.dumps(payload_str, sort_keys=True).encode()).hexdigest()
+    return payload_str, digest
+
+
+def envelope_path(body: bytes):
+    req = IngestRequest.model_validate_json(body)
+    payload = canonical_json(req.payload)
+    return payload.decode(), hash_bytes(payload)
+
+
+def raw_path(raw_payload: bytes):
+    payload = canonical_json(loads(raw_payload))
+    return payload.decode(), hash_bytes(payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest payload serialization + hashing")
+    parser.add_argument("--number", type=int, default=2000, help="Iterations per case")
+    parser.add_argument("--scale", type=int, default=1, help="Multiply sample posts to grow the payload")
+    args = parser.parse_args()
+
+    body = load_request_body(args.scale)
+    raw_payload = json.dumps(json.loads(body)["payload"]).encode()
+
+    print(f"Request body: {len(body):,} bytes, {args.number} iterations\n")
+
+    cases = [
+        ("legacy (dumps x2)", lambda: legacy_path(body)),
+        ("POST /ingest/{domain}", lambda: envelope_path(body)),
+        ("POST /ingest/{domain}/raw", lambda: raw_path(raw_payload)),
+    ]
+    baseline = None
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=args.number, repeat=3))
+        per_req_us = best / args.number * 1e6
+        baseline = baseline or per_req_us
+        print(f"{name:<28} {per_req_us:>10.1f} us/request   {baseline / per_req_us:>5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
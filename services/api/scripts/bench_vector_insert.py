@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import timeit
+
+# Ensure we can import 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncpg
+import numpy as np
+
+from app.core.vector import _decode, _encode, register_vector, to_vector
+
+DIM = 3072
+
+
+def text_literal(vector) -> str:
+    # Pre-change encoding: decimal text parsed again by vector_in
+    return f"[{','.join(map(str, vector))}]"
+
+
+def binary_literal(vector) -> bytes:
+    return _encode(to_vector(vector))
+
+
+def bench_encoding(vectors, number: int):
+    vector = vectors[0]
+    text_size = len(text_literal(vector).encode())
+    binary_size = len(binary_literal(vector))
+    print(f"Payload per {DIM}-dim vector: text {text_size:,} bytes, binary {binary_size:,} bytes "
+          f"({text_size / binary_size:.1f}x smaller)")
+
+    cases = [
+        ("text  [x,y,...]", lambda: text_literal(vector)),
+        ("binary float32", lambda: binary_literal(vector)),
+    ]
+    baseline = None
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=number, repeat=3))
+        per_vec_us = best / number * 1e6
+        baseline = baseline or per_vec_us
+        print(f"encode {name:<18} {per_vec_us:>10.1f} us/vector   {baseline / per_vec_us:>5.2f}x")
+
+    decoded = _decode(binary_literal(vector))
+    assert np.allclose(decoded, vector, atol=1e-6), "binary round trip mismatch"
+
+
+async def bench_inserts(dsn: str, vectors, batch: int):
+    rows = [(i, v) for i, v in enumerate(vectors)]
+    results = {}
+
+    # Text: the pre-change path, no codec registered
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute(f"CREATE TEMP TABLE bench_vectors (id INT, embedding VECTOR({DIM}))")
+        started = time.perf_counter()
+        for i in range(0, len(rows), batch):
+            await conn.executemany(
+                "INSERT INTO bench_vectors VALUES ($1, $2::text::vector)",
+                [(n, text_literal(v)) for n, v in rows[i:i + batch]],
+            )
+        results["text"] = time.perf_counter() - started
+    finally:
+        await conn.close()
+
+    # Binary: codec from app.core.vector, float32 arrays bound directly
+    conn = await asyncpg.connect(dsn)
+    try:
+        await register_vector(conn)
+        await conn.execute(f"CREATE TEMP TABLE bench_vectors (id INT, embedding VECTOR({DIM}))")
+        started = time.perf_counter()
+        for i in range(0, len(rows), batch):
+            await conn.executemany(
+                "INSERT INTO bench_vectors VALUES ($1, $2)",
+                [(n, to_vector(v)) for n, v in rows[i:i + batch]],
+            )
+        results["binary"] = time.perf_counter() - started
+        stored = await conn.fetchval("SELECT embedding FROM bench_vectors ORDER BY id LIMIT 1")
+        assert np.allclose(stored, vectors[0], atol=1e-6), "stored vector mismatch"
+    finally:
+        await conn.close()
+
+    print(f"\nInserting {len(rows)} rows in batches of {batch}:")
+    for name, elapsed in results.items():
+        print(f"insert {name:<7} {len(rows) / elapsed:>10.1f} rows/s   {elapsed * 1000:>9.1f} ms total   "
+              f"{results['text'] / elapsed:>5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark text vs binary pgvector encoding for embedding writes")
+    parser.add_argument("--number", type=int, default=200, help="Encode iterations per case")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows to insert per case (with --dsn)")
+    parser.add_argument("--batch", type=int, default=100, help="Rows per executemany call")
+    parser.add_argument("--dsn", help="postgresql:// DSN of a database with pgvector; skips inserts if omitted")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    # Embeddings as returned by the OpenAI client: lists of Python floats
+    vectors = [[rng.uniform(-1, 1) for _ in range(DIM)] for _ in range(args.rows if args.dsn else 1)]
+
+    bench_encoding(vectors, args.number)
+    if args.dsn:
+        asyncio.run(bench_inserts(args.dsn, vectors, args.batch))
+    else:
+        print("\nNo --dsn given: skipping insert throughput")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,6 +18,7 @@ from app.core.db import get_db, SessionLocal, engine as master_engine
 from app.core.tenant_store import get_tenant_db
 from app.core.tenant_db import get_tenant_session
 from app.core.tenant_schema import tenant_schema_name
+from app.core.notify import notify_ingest
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -273,6 +274,10 @@ class DataGenerator:
                         acc
                     )
 
+                # Wake the workers for this tenant once the rows are visible
+                for table in ("raw_social_posts", "raw_social_interactions", "raw_account_metrics", "raw_events"):
+                    await notify_ingest(session, schema, table)
+
                 await session.commit()
                 print("✅ Data seeding complete!")
                 
@@ -79,13 +79,13 @@ async def run_summary_cycle(tenant_id):
     """Runs the summary worker logic for a single cycle using subprocess."""
     logger.info("Running summary worker cycle (subprocess)...")
     
-    log_file = os.path.join(WORKER_DIR, "llm_summary_input.log")
+    log_file = os.path.join(WORKER_DIR, f"llm_summary_input_{tenant_schema_name(tenant_id)}.log")
     if os.path.exists(log_file):
         os.remove(log_file)
 
     cmd = [
         sys.executable, "-c", 
-        "import asyncio; from app.summarizer import SummaryWorker; asyncio.run(SummaryWorker().process_cycle())"
+        "import asyncio; from app.summarizer import SummaryWorker; asyncio.run(SummaryWorker().run_once())"
     ]
     
     proc = subprocess.run(cmd, cwd=WORKER_DIR, capture_output=True, text=True)
@@ -109,6 +109,24 @@ CREATE INDEX IF NOT EXISTS idx_raw_events_brand
 CREATE INDEX IF NOT EXISTS idx_raw_events_domain
     ON raw_events(domain);
 
+-- Idempotent ingest: the API inserts with ON CONFLICT DO NOTHING on this key.
+-- Drop exact retries left over from before the index existed (keeps the
+-- earliest copy) so the unique index can be built on existing schemas.
+DELETE FROM raw_events a
+    USING raw_events b
+    WHERE a.brand_id = b.brand_id
+      AND a.domain = b.domain
+      AND a.payload_hash = b.payload_hash
+      AND a.event_id > b.event_id
+      AND NOT EXISTS (
+          SELECT 1 FROM pg_indexes
+          WHERE schemaname = current_schema()
+            AND indexname = 'uq_raw_events_payload'
+      );
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_raw_events_payload
+    ON raw_events(brand_id, domain, payload_hash);
+
 
 
 /* ============================================================
@@ -134,6 +152,11 @@ CREATE TABLE IF NOT EXISTS dim_account (
     last_updated TIMESTAMP
 );
 
+-- Serve API: accounts of a brand, paginated by account_id (keyset).
+-- The dim_account model re-creates it after a --full-refresh rebuild.
+CREATE INDEX IF NOT EXISTS dim_account_brand_id_account_id_idx
+    ON dim_account(brand_id, account_id);
+
 
 
 /* ------------------------------------------------------------
@@ -195,6 +218,16 @@ CREATE TABLE IF NOT EXISTS post_embeddings (
     created_at TIMESTAMP DEFAULT now()
 );
 
+-- ANN index for /analysis/search. pgvector indexes cap vector at 2000
+-- dims, so the index is built over a halfvec(3072) cast (limit 4000 dims,
+-- pgvector >= 0.7). Queries must order by the same expression to use it.
+CREATE INDEX IF NOT EXISTS idx_post_embeddings_hnsw
+    ON post_embeddings
+    USING hnsw ((embedding::halfvec(3072)) halfvec_cosine_ops);
+
+CREATE INDEX IF NOT EXISTS idx_post_embeddings_created_at
+    ON post_embeddings(created_at);
+
 
 
 /* ============================================================
@@ -215,6 +248,74 @@ CREATE INDEX IF NOT EXISTS idx_sentiment_results_sentiment
     ON sentiment_results(sentiment);
 
 
+/* ------------------------------------------------------------
+   SENTIMENT FAILURES
+   Interactions the worker could not classify (LLM throttled,
+   errors, unusable answers). They are kept out of
+   sentiment_results and retried from here with a backoff until
+   SENTIMENT_MAX_ATTEMPTS, after which the row stays as a
+   dead letter. Deleted once the interaction is classified.
+   ------------------------------------------------------------ */
+
+CREATE TABLE IF NOT EXISTS sentiment_failures (
+    interaction_id TEXT PRIMARY KEY,
+    row_id BIGINT NOT NULL,            -- raw_social_interactions.id to re-read the text from
+    attempts INT NOT NULL DEFAULT 1,
+    last_error TEXT,
+    retry_at TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_sentiment_failures_retry_at
+    ON sentiment_failures(retry_at);
+
+
+/* ------------------------------------------------------------
+   WORKER CURSORS
+   High-water mark (last processed raw row id) per worker,
+   so each poll is an index range scan over new rows only.
+   Ids are assigned at insert, not at commit, so last_id never
+   passes safe_id: every id up to it is committed or rolled
+   back. horizon_id becomes safe once the oldest transaction in
+   progress is newer than horizon_xmax (snapshot xmax taken
+   right after horizon_id was read).
+   ------------------------------------------------------------ */
+
+CREATE TABLE IF NOT EXISTS worker_cursors (
+    cursor_name TEXT PRIMARY KEY,     -- sentiment | ...
+    last_id BIGINT NOT NULL DEFAULT 0,
+    safe_id BIGINT NOT NULL DEFAULT 0,
+    horizon_id BIGINT,
+    horizon_xmax BIGINT,
+    updated_at TIMESTAMP DEFAULT now()
+);
+
+
+/* ------------------------------------------------------------
+   ANALYSIS JOBS
+   /analysis/summarize requests queued with "background": true.
+   The worker claims them (FOR UPDATE SKIP LOCKED), writes the
+   summary to post_embeddings and the outcome back here.
+   ------------------------------------------------------------ */
+
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    job_id UUID PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'queued',   -- queued | running | succeeded | failed
+    payload TEXT NOT NULL,                   -- serialized exactly as the sync path sends it to the LLM
+    result JSONB,
+    error TEXT,
+    attempts INT NOT NULL DEFAULT 0,
+    not_before TIMESTAMP NOT NULL DEFAULT now(),  -- retry backoff: not claimed earlier
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_analysis_jobs_pending
+    ON analysis_jobs(created_at)
+    WHERE status IN ('queued', 'running');
+
+
 /* ============================================================
    SUMMARY LOGGING / CHECKPOINTING
    ============================================================ */
@@ -229,6 +330,19 @@ CREATE TABLE IF NOT EXISTS summary_checkpoint (
 CREATE INDEX IF NOT EXISTS idx_summary_checkpoint_time
     ON summary_checkpoint(last_summarized_at);
 
+/* ------------------------------------------------------------
+   Per-table summary checkpoints: key (timestamp column, primary
+   key) of the last row folded into a summary, stored as text and
+   cast back to the column types. Each run resumes exactly after it.
+   ------------------------------------------------------------ */
+
+CREATE TABLE IF NOT EXISTS summary_table_checkpoints (
+    table_name TEXT PRIMARY KEY,
+    last_ts TEXT NOT NULL,
+    last_pk TEXT,
+    updated_at TIMESTAMP DEFAULT now()
+);
+
 
 -- CREATE INDEX IF NOT EXISTS idx_rao_brand
 --     ON raw_analysis_output(brand_id);
@@ -0,0 +1,33 @@
+/* ============================================================
+   TENANT REGISTRY (MASTER DB ONLY)
+   Maps each tenant to the Postgres shard that holds its schema.
+   Tenants without a row here are routed to the default shard
+   (the database in MASTER_DB_URL).
+
+   Apply once against the master DB:
+     psql "$MASTER_DB_URL" -f services/api/sql/tenant_registry.sql
+
+   Moving a tenant to another instance is a data change only:
+     UPDATE tenant_registry SET shard_id = 'shard_2' WHERE tenant_id = 'org_...';
+   ============================================================ */
+
+CREATE TABLE IF NOT EXISTS tenant_shards (
+    shard_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    port INT NOT NULL DEFAULT 5432,
+    db_name TEXT NOT NULL,
+    db_user TEXT NOT NULL,
+    db_password TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS tenant_registry (
+    tenant_id TEXT PRIMARY KEY,
+    shard_id TEXT NOT NULL REFERENCES tenant_shards(shard_id),
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT now(),
+    updated_at TIMESTAMP DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_tenant_registry_shard
+    ON tenant_registry(shard_id) WHERE is_active;
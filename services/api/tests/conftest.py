@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Ensure we can import 'app'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
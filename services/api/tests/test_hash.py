@@ -0,0 +1,35 @@
+import pytest
+
+from app.utils.hash import canonical_json, hash_payload
+
+PAYLOAD = {
+    "b": [1, 2.5, 1e16, 1e-7, None, True],
+    "a": {"z": "é\u2028\x00", "y": -0.0},
+    "n": 18446744073709551615,
+}
+
+# The ingest idempotency key: changing these bytes re-keys every stored payload
+EXPECTED = (
+    b'{"a":{"y":-0.0,"z":"\xc3\xa9\xe2\x80\xa8\\u0000"},'
+    b'"b":[1,2.5,1e16,1e-7,null,true],'
+    b'"n":18446744073709551615}'
+)
+
+
+def test_canonical_json_bytes_are_pinned():
+    assert canonical_json(PAYLOAD) == EXPECTED
+
+
+def test_hash_is_stable():
+    assert hash_payload(PAYLOAD) == "1a050b66e599f589042b0b1e5caa4da324fc23ced67deebdbf45b9e432f8761d"
+
+
+def test_key_order_does_not_change_the_hash():
+    reordered = {"n": PAYLOAD["n"], "a": {"y": -0.0, "z": "é\u2028\x00"}, "b": PAYLOAD["b"]}
+    assert hash_payload(reordered) == hash_payload(PAYLOAD)
+
+
+@pytest.mark.parametrize("payload", [{1: "x"}, {"big": 2**64}])
+def test_unencodable_payloads_are_rejected(payload):
+    with pytest.raises(ValueError):
+        canonical_json(payload)
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from app.routes.ingest import _iter_ndjson_lines
+
+
+def _lines(chunks, max_line_bytes=10):
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [
+            "too long" if isinstance(line, ValueError) else line
+            async for line in _iter_ndjson_lines(stream(), max_line_bytes)
+        ]
+
+    return asyncio.run(collect())
+
+
+def test_lines_split_across_chunks():
+    assert _lines([b'{"a"', b':1}\n{"b":', b"2}\n"]) == [b'{"a":1}', b'{"b":2}']
+
+
+def test_last_line_without_newline():
+    assert _lines([b"one\ntwo"]) == [b"one", b"two"]
+
+
+def test_blank_lines_are_skipped():
+    assert _lines([b"\n  \none\n\n", b"\n"]) == [b"one"]
+
+
+def test_several_lines_in_one_chunk():
+    assert _lines([b"a\nb\nc\n"]) == [b"a", b"b", b"c"]
+
+
+@pytest.mark.parametrize("chunks", [
+    [b"x" * 11 + b"\nok\n"],
+    [b"xxxxxx", b"xxxxxx", b"xxxxxx\nok\n"],
+    [b"xxxxxx", b"xxxxx", b"\nok\n"],
+])
+def test_oversized_line_is_reported_once_and_skipped(chunks):
+    assert _lines(chunks) == ["too long", b"ok"]
+
+
+def test_oversized_last_line():
+    assert _lines([b"ok\n", b"x" * 6, b"x" * 6]) == [b"ok", "too long"]
+
+
+def test_line_at_the_limit_is_kept():
+    assert _lines([b"x" * 5, b"x" * 5, b"\n"]) == [b"x" * 10]
+
+
+def test_long_line_in_many_chunks():
+    chunks = [b"y" * 100] * 1000 + [b"\n"]
+    assert _lines(chunks, max_line_bytes=100_000) == [b"y" * 100_000]
@@ -0,0 +1,31 @@
+import pytest
+from fastapi import HTTPException
+
+from app.routes.serve import _decode_cursor, _encode_cursor, _etag_matches
+
+
+@pytest.mark.parametrize("account_id", ["a", "ab", "abc", "acct_17", "ünï/cødé+?=", ""])
+def test_cursor_round_trip(account_id):
+    cursor = _encode_cursor(account_id)
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert _decode_cursor(cursor) == account_id
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "a", "_w"])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as exc:
+        _decode_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+])
+def test_etag_matches(header, matches):
+    assert _etag_matches(header, '"abc"') is matches
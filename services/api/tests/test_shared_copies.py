@@ -0,0 +1,23 @@
+from pathlib import Path
+
+import pytest
+
+SERVICES = Path(__file__).resolve().parents[2]
+
+# Modules copied into both services: the cache key, the pgvector wire format
+# and the /analysis/summarize prompts must agree between the API and the worker
+SHARED = ("app/core/vector.py", "app/core/embedding_cache.py", "app/core/analysis_prompts.py")
+
+
+def _normalized(path: Path) -> list[str]:
+    # The logger name is the one line allowed to differ
+    return [
+        line for line in path.read_text().splitlines()
+        if not line.startswith("logger = logging.getLogger(")
+    ]
+
+
+@pytest.mark.parametrize("module", SHARED)
+def test_service_copies_match(module):
+    api, worker = SERVICES / "api" / module, SERVICES / "worker" / module
+    assert _normalized(api) == _normalized(worker), f"{module} differs between services/api and services/worker"
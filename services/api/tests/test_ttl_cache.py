@@ -0,0 +1,56 @@
+import time
+
+from app.utils.ttl_cache import TTLCache
+
+
+def _sized(max_size=100, max_bytes=10):
+    return TTLCache(max_size, 60, max_bytes=max_bytes, sizeof=len)
+
+
+def test_evicts_least_recently_used_past_max_bytes():
+    cache = _sized()
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    assert cache.get("a") == b"1234"  # b is now the oldest
+    cache.set("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234" and cache.get("c") == b"1234"
+    assert cache.bytes == 8
+
+
+def test_value_larger_than_max_bytes_is_not_stored():
+    cache = _sized()
+    cache.set("a", b"1234")
+    cache.set("big", b"x" * 11)
+    assert cache.get("big") is None
+    assert cache.get("a") == b"1234"
+    assert cache.bytes == 4
+
+
+def test_bytes_follow_replace_pop_and_clear():
+    cache = _sized()
+    cache.set("a", b"1234")
+    cache.set("a", b"12")
+    assert cache.bytes == 2 and len(cache) == 1
+    assert cache.pop("a") == b"12"
+    assert cache.bytes == 0
+    cache.set("b", b"123")
+    cache.clear()
+    assert cache.bytes == 0 and len(cache) == 0
+
+
+def test_expired_entries_are_dropped(monkeypatch):
+    cache = _sized()
+    cache.set("a", b"1234", ttl_seconds=1)
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 2)
+    assert cache.get("a") is None
+    assert cache.bytes == 0
+
+
+def test_max_size_without_sizeof():
+    cache = TTLCache(2, 60)
+    for key in "abc":
+        cache.set(key, key)
+    assert cache.get("a") is None and len(cache) == 2
+    assert cache.bytes == 0
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from app.core.vector import _decode, _encode, to_vector
+
+
+@pytest.mark.parametrize("values", [[0.0], [1.5, -2.25, 3e-8], list(np.linspace(-1, 1, 3072))])
+def test_binary_codec_round_trip(values):
+    decoded = _decode(_encode(values))
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, np.asarray(values, dtype=np.float32))
+
+
+def test_wire_format_is_pgvector_binary():
+    # int16 dim, int16 unused, then big-endian float4s
+    assert _encode([1.0, -2.0]) == b"\x00\x02\x00\x00" + b"\x3f\x80\x00\x00" + b"\xc0\x00\x00\x00"
+
+
+def test_rejects_matrices():
+    with pytest.raises(ValueError):
+        _encode([[1.0, 2.0]])
+
+
+def test_to_vector_treats_empty_as_null():
+    assert to_vector(None) is None
+    assert to_vector([]) is None
+    assert to_vector([1, 2]).dtype == np.float32
@@ -1,4 +1,10 @@
-{{ config(materialized='incremental', unique_key='account_id') }}
+{# The index is also created by bootstrap.sql; the post_hook puts it back
+   when --full-refresh rebuilds the table #}
+{{ config(
+    materialized='incremental',
+    unique_key='account_id',
+    post_hook="CREATE INDEX IF NOT EXISTS dim_account_brand_id_account_id_idx ON {{ this }} (brand_id, account_id)"
+) }}
 
 SELECT DISTINCT ON (account_id)
   account_id,
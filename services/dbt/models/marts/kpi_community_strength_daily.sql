@@ -10,6 +10,8 @@ interactions AS (
 
 sentiment AS (
     SELECT * FROM {{ source('raw', 'sentiment_results') }}
+    -- Placeholders written by older workers for interactions they could not classify
+    WHERE model_version IS DISTINCT FROM 'unclassified'
 ),
 
 advocacy_data AS (
@@ -5,6 +5,8 @@ WITH interactions AS (
 
 sentiment AS (
     SELECT * FROM {{ source('raw', 'sentiment_results') }}
+    -- Placeholders written by older workers for interactions they could not classify
+    WHERE model_version IS DISTINCT FROM 'unclassified'
 ),
 
 joined AS (
@@ -0,0 +1,21 @@
+# Kept identical in services/api and services/worker, so a background
+# /analysis/summarize job sends the model exactly what the synchronous path
+# would; services/api/tests/test_shared_copies.py fails if they drift.
+
+SUMMARY_SYSTEM_PROMPT = "You are a helpful assistant."
+SUMMARY_MAX_COMPLETION_TOKENS = 16384
+
+SUMMARY_PROMPTS = (
+    # First Summary: Broad summary
+    "Create a detailed summary info of all the social media handle details provided for the company. The summary should have every detail especially in terms of nos and overall context, it should capture every possible information which will be important for executives of that company.",
+    # Second Summary: "summarize the json output" (interpreted as structure/highlights)
+    "Summarize the provided JSON output data structure and content highlights. Capture the numbers,scores, issues, recommendations, etc whichever is important and relevant for the company to know and grow. IT should have every detailed information about each KPIs. The summary should be very detailed and should capture every possible information which will be important for executives of that company.",
+)
+
+
+def summary_messages(content: str, instruction: str) -> list[dict]:
+    """Chat messages for one summary of `content` (the serialized payload)."""
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": f"{instruction}\n\nInput Data:\n{content}"},
+    ]
@@ -0,0 +1,82 @@
+import logging
+import time
+from dataclasses import dataclass
+from sqlalchemy import text
+
+logger = logging.getLogger("worker-catalog")
+
+# Tables/views of many schemas with their columns, column types and
+# single-column primary key, in one round-trip
+CATALOG_QUERY = text("""
+    SELECT
+        n.nspname AS schema_name,
+        c.relname AS table_name,
+        array_agg(a.attname::text ORDER BY a.attnum) AS columns,
+        array_agg(format_type(a.atttypid, a.atttypmod) ORDER BY a.attnum) AS types,
+        (
+            SELECT pa.attname::text
+            FROM pg_catalog.pg_index i
+            JOIN pg_catalog.pg_attribute pa ON pa.attrelid = i.indrelid AND pa.attnum = i.indkey[0]
+            WHERE i.indrelid = c.oid AND i.indisprimary AND i.indnatts = 1
+        ) AS pk
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE n.nspname = ANY(CAST(:schemas AS text[]))
+      AND c.relkind IN ('r', 'p', 'v')
+      AND c.relname <> ALL(CAST(:excluded AS text[]))
+    GROUP BY c.oid, n.nspname, c.relname
+""")
+
+
+@dataclass
+class TableInfo:
+    columns: list[str]
+    types: list[str]
+    ts_col: str | None
+    pk: str | None = None
+
+    def type_of(self, column: str) -> str:
+        return self.types[self.columns.index(column)]
+
+
+class SchemaCatalog:
+    """
+    Per-schema cache of tables, their columns and the timestamp column used
+    to find changed rows. Missing or expired schemas on a shard are loaded
+    together with one pg_catalog query. Entries expire after ttl_seconds and
+    are dropped early on schema_changed notifications (bootstrap, dbt run).
+    """
+
+    def __init__(self, ttl_seconds: float, ts_candidates: list[str], excluded: tuple[str, ...] = ()):
+        self.ttl_seconds = ttl_seconds
+        self.ts_candidates = ts_candidates
+        self.excluded = list(excluded)
+        self._entries = {}  # schema -> (expires_at, {table: TableInfo})
+
+    def _pick_ts(self, columns: list[str]) -> str | None:
+        return next((c for c in self.ts_candidates if c in columns), None)
+
+    async def load(self, session, schemas: list[str]):
+        """Fetches every schema in `schemas` that is not cached yet (all on the session's shard)."""
+        now = time.monotonic()
+        stale = [s for s in schemas if self._entries.get(s, (0.0,))[0] <= now]
+        if not stale:
+            return
+        res = await session.execute(CATALOG_QUERY, {"schemas": stale, "excluded": self.excluded})
+        loaded = {s: {} for s in stale}
+        for r in res.fetchall():
+            loaded[r.schema_name][r.table_name] = TableInfo(r.columns, r.types, self._pick_ts(r.columns), r.pk)
+        for schema, tables in loaded.items():
+            self._entries[schema] = (now + self.ttl_seconds, tables)
+        logger.info(f"Loaded catalog for {len(stale)} schemas")
+
+    def tables(self, schema: str) -> dict[str, TableInfo]:
+        entry = self._entries.get(schema)
+        return entry[1] if entry else {}
+
+    def invalidate(self, schema: str | None = None):
+        if schema is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(schema, None)
@@ -0,0 +1,174 @@
+from dataclasses import dataclass, field
+from sqlalchemy import text
+from app.core.catalog import TableInfo
+
+NUMERIC_TYPES = ("smallint", "integer", "bigint", "numeric", "real", "double precision")
+CATEGORICAL_TYPES = ("text", "character varying", "character", "boolean")
+# Identifier-like columns say nothing in aggregate
+SKIP_SUFFIXES = ("_id", "_hash", "_url", "permalink")
+
+
+@dataclass
+class Checkpoint:
+    """Key of the last summarized row, as text (cast back to the column types in SQL)."""
+    ts: str | None = None
+    pk: str | None = None
+
+
+@dataclass
+class TableChanges:
+    table: str
+    rows: int
+    first_ts: str
+    end: Checkpoint
+    capped: bool
+    numeric: dict = field(default_factory=dict)  # column -> {sum, avg, min, max, delta}
+    top: dict = field(default_factory=dict)  # column -> [(value, count), ...]
+
+    def to_text(self, ts_col: str) -> str:
+        lines = [f"rows changed: {self.rows} ({ts_col} {self.first_ts} .. {self.end.ts})"]
+        if self.capped:
+            lines[0] += " [window capped, more changes follow in the next run]"
+        for col, stats in self.numeric.items():
+            parts = ", ".join(f"{k}={_fmt(v)}" for k, v in stats.items() if v is not None)
+            if parts:
+                lines.append(f"{col}: {parts}")
+        for col, values in self.top.items():
+            lines.append(f"{col} top values: " + ", ".join(f"{v} ({n})" for v, n in values))
+        return "\n".join(lines)
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float) or hasattr(value, "is_finite"):  # float / Decimal
+        return f"{float(value):,.2f}"
+    return str(value)
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _is_identifier(col: str) -> bool:
+    return col == "id" or col.endswith(SKIP_SUFFIXES)
+
+
+def _is_type(type_name: str, family: tuple[str, ...]) -> bool:
+    # Arrays (e.g. "integer[]") would break sum()/avg() and make poor categories
+    return type_name.startswith(family) and not type_name.endswith("]")
+
+
+def _window_sql(schema: str, table: str, info: TableInfo, cp: Checkpoint) -> tuple[str, list[str]]:
+    """
+    Returns (CTE selecting the next window of changed rows, key columns).
+    With a primary key the window is the next `:cap` rows in (ts, pk) order
+    after the checkpoint. Without one it is extended to every row sharing the
+    last timestamp, so the ts-only checkpoint cannot split a tie.
+    """
+    ts, ts_type = _q(info.ts_col), info.type_of(info.ts_col)
+    source = f"{_q(schema)}.{_q(table)}"
+
+    if cp.ts is None:
+        after = f"{ts} IS NOT NULL"
+    elif info.pk and cp.pk is not None:
+        pk_type = info.type_of(info.pk)
+        after = (
+            f"({ts}, {_q(info.pk)}) > (CAST(CAST(:cp_ts AS text) AS {ts_type}), "
+            f"CAST(CAST(:cp_pk AS text) AS {pk_type}))"
+        )
+    else:
+        after = f"{ts} > CAST(CAST(:cp_ts AS text) AS {ts_type})"
+
+    if info.pk:
+        keys = [ts, _q(info.pk)]
+        cte = f"SELECT * FROM {source} WHERE {after} ORDER BY {', '.join(keys)} LIMIT :cap"
+    else:
+        keys = [ts]
+        cte = f"""
+            SELECT * FROM {source}
+            WHERE {after} AND {ts} <= (
+                SELECT max(k.ts) FROM (
+                    SELECT {ts} AS ts FROM {source} WHERE {after} ORDER BY {ts} LIMIT :cap
+                ) k
+            )
+        """
+    return cte, keys
+
+
+async def extract_changes(
+    session, schema: str, table: str, info: TableInfo, cp: Checkpoint,
+    cap: int, top_n: int, max_distinct: int,
+) -> TableChanges | None:
+    """
+    Aggregates the next window (at most ~cap rows) of changes after `cp`
+    server-side: row count, numeric sum/avg/min/max/delta (last minus
+    first value in the window) and top-N values of low-cardinality columns.
+    Returns None if nothing changed.
+    """
+    cte, keys = _window_sql(schema, table, info, cp)
+    order = ", ".join(keys)
+    desc = ", ".join(f"{k} DESC" for k in keys)
+    params = {"cap": cap, "cp_ts": cp.ts, "cp_pk": cp.pk}
+    params = {k: v for k, v in params.items() if f":{k}" in cte}
+
+    numeric = [
+        c for c, t in zip(info.columns, info.types)
+        if _is_type(t, NUMERIC_TYPES) and c != info.pk and not _is_identifier(c)
+    ]
+    select = [
+        "count(*) AS n",
+        f"min({_q(info.ts_col)})::text AS first_ts",
+        f"(array_agg({_q(info.ts_col)}::text ORDER BY {desc}))[1] AS end_ts",
+        f"(array_agg({_q(info.pk)}::text ORDER BY {desc}))[1] AS end_pk" if info.pk else "NULL AS end_pk",
+    ]
+    for i, col in enumerate(numeric):
+        c = _q(col)
+        select += [
+            f"sum({c}) AS n{i}_sum",
+            f"avg({c}) AS n{i}_avg",
+            f"min({c}) AS n{i}_min",
+            f"max({c}) AS n{i}_max",
+            f"(array_agg({c} ORDER BY {desc}) FILTER (WHERE {c} IS NOT NULL))[1]"
+            f" - (array_agg({c} ORDER BY {order}) FILTER (WHERE {c} IS NOT NULL))[1] AS n{i}_delta",
+        ]
+
+    res = await session.execute(text(f"WITH w AS ({cte}) SELECT {', '.join(select)} FROM w"), params)
+    row = res.fetchone()
+    if not row or not row.n:
+        return None
+
+    m = row._mapping
+    changes = TableChanges(
+        table=table,
+        rows=row.n,
+        first_ts=row.first_ts,
+        end=Checkpoint(row.end_ts, row.end_pk),
+        capped=row.n >= cap,
+        numeric={
+            col: {k: m[f"n{i}_{k}"] for k in ("sum", "avg", "min", "max", "delta")}
+            for i, col in enumerate(numeric)
+        },
+    )
+
+    categorical = [
+        c for c, t in zip(info.columns, info.types)
+        if _is_type(t, CATEGORICAL_TYPES) and c not in (info.pk, info.ts_col) and not _is_identifier(c)
+    ]
+    if categorical and top_n > 0:
+        values = ", ".join(f"({i}, {_q(c)}::text)" for i, c in enumerate(categorical))
+        res = await session.execute(text(f"""
+            WITH w AS ({cte})
+            SELECT col, val, n FROM (
+                SELECT v.col, v.val, count(*) AS n,
+                       row_number() OVER (PARTITION BY v.col ORDER BY count(*) DESC, v.val) AS rk,
+                       count(*) OVER (PARTITION BY v.col) AS distinct_values
+                FROM w CROSS JOIN LATERAL (VALUES {values}) AS v(col, val)
+                WHERE v.val IS NOT NULL
+                GROUP BY v.col, v.val
+            ) ranked
+            WHERE rk <= :top_n AND distinct_values <= :max_distinct
+            ORDER BY col, rk
+        """), {**params, "top_n": top_n, "max_distinct": max_distinct})
+        for r in res.fetchall():
+            changes.top.setdefault(categorical[r.col], []).append((r.val, r.n))
+
+    return changes
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import numpy as np
+from sqlalchemy import text
+
+# Kept identical in services/api and services/worker apart from the logger
+# name; services/api/tests/test_shared_copies.py fails if they drift.
+logger = logging.getLogger("worker-embedding-cache")
+
+# Shared by the API and the worker, so it lives in the master DB. Vectors
+# are stored as raw little-endian float32 (no pgvector needed there).
+DDL = """
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        model TEXT NOT NULL,
+        text_hash TEXT NOT NULL,
+        embedding BYTEA NOT NULL,
+        created_at TIMESTAMP DEFAULT now(),
+        PRIMARY KEY (model, text_hash)
+    )
+"""
+
+_STORED_DTYPE = np.dtype("<f4")
+
+
+def text_key(text_content: str) -> str:
+    return hashlib.sha256(text_content.encode()).hexdigest()
+
+
+def _estimate_tokens(text_content: str) -> int:
+    return len(text_content) // 4 + 1
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by (model, sha256(text)), with an in-process LRU of
+    float32 vectors in front of the master-DB embedding_cache table.
+
+    Concurrent requests for the same text share one lookup (single flight).
+    Texts missing from both tiers are queued for batch_window_seconds and
+    sent together with one `create(texts)` call per max_inputs texts /
+    max_tokens estimated tokens.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        create: Callable[[list[str]], Awaitable[list[list[float]]]],
+        session_factory,
+        memory_size: int,
+        db_enabled: bool,
+        max_inputs: int,
+        max_tokens: int,
+        batch_window_seconds: float,
+    ):
+        self.model = model
+        self.create = create
+        self.session_factory = session_factory
+        self.memory_size = memory_size
+        self.db_enabled = db_enabled
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        self.batch_window_seconds = batch_window_seconds
+        self._memory = OrderedDict()  # key -> float32 vector
+        self._inflight = {}  # key -> future shared by every waiter
+        self._queue = []  # (key, text) waiting for the next create() call
+        self._flusher = None
+        self._ready = False
+        self._setup_lock = asyncio.Lock()
+        self._tasks = set()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.calls = 0
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _spawn(self, coro):
+        # Runs independently of the caller, so a cancelled request cannot
+        # strand the other waiters of a shared lookup
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def embed(self, texts: list[str]) -> list[np.ndarray]:
+        """Returns one float32 vector per text, in order. Raises if the embeddings call failed."""
+        loop = asyncio.get_running_loop()
+        keys = [text_key(t) for t in texts]
+        results, waiting, new = {}, {}, {}
+        for key, text_content in zip(keys, texts):
+            if key in results or key in waiting:
+                continue
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                results[key] = self._memory[key]
+                self.memory_hits += 1
+            elif key in self._inflight:
+                waiting[key] = self._inflight[key]
+                self.coalesced += 1
+            else:
+                waiting[key] = self._inflight[key] = loop.create_future()
+                new[key] = text_content
+
+        if new:
+            self._spawn(self._resolve(new))
+        for key, future in waiting.items():
+            results[key] = await asyncio.shield(future)
+        return [results[k] for k in keys]
+
+    async def _ensure_table(self) -> bool:
+        if self._ready or not self.db_enabled:
+            return self._ready
+        async with self._setup_lock:
+            if not self._ready and self.db_enabled:
+                try:
+                    async with self.session_factory() as session:
+                        await session.execute(text(DDL))
+                        await session.commit()
+                    self._ready = True
+                except Exception:
+                    logger.exception("Embedding cache table setup failed; DB tier disabled")
+                    self.db_enabled = False
+        return self._ready
+
+    async def _resolve(self, new: dict):
+        """DB tier lookup for `new` ({key: text}); what is still missing is queued for create()."""
+        if await self._ensure_table():
+            try:
+                async with self.session_factory() as session:
+                    res = await session.execute(text("""
+                        SELECT text_hash, embedding
+                        FROM embedding_cache
+                        WHERE model = :model AND text_hash = ANY(CAST(:keys AS text[]))
+                    """), {"model": self.model, "keys": list(new)})
+                    for row in res.fetchall():
+                        vector = np.frombuffer(row.embedding, dtype=_STORED_DTYPE).astype(np.float32)
+                        self._remember(row.text_hash, vector)
+                        self._inflight.pop(row.text_hash).set_result(vector)
+                        del new[row.text_hash]
+                        self.db_hits += 1
+            except Exception:
+                logger.exception("Embedding cache lookup failed")
+
+        if new:
+            self.misses += len(new)
+            self._queue.extend(new.items())
+            if self._flusher is None:
+                self._flusher = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # Collect texts from concurrent callers for one window, then split
+        # them into as few create() calls as the input limits allow
+        await asyncio.sleep(self.batch_window_seconds)
+        queue, self._queue, self._flusher = self._queue, [], None
+        batch, tokens = [], 0
+        for key, text_content in queue:
+            cost = _estimate_tokens(text_content)
+            if batch and (len(batch) >= self.max_inputs or tokens + cost > self.max_tokens):
+                self._spawn(self._embed_batch(batch))
+                batch, tokens = [], 0
+            batch.append((key, text_content))
+            tokens += cost
+        if batch:
+            self._spawn(self._embed_batch(batch))
+
+    async def _embed_batch(self, batch: list[tuple[str, str]]):
+        self.calls += 1
+        try:
+            vectors = await self.create([t for _, t in batch])
+            if len(vectors) != len(batch):
+                raise ValueError(f"expected {len(batch)} embeddings, got {len(vectors)}")
+        except Exception as e:
+            logger.error(f"Embedding call failed for {len(batch)} texts: {e}")
+            for key, _ in batch:
+                future = self._inflight.pop(key)
+                future.set_exception(e)
+                future.exception()  # a waiter may have gone away; do not warn about it
+            return
+
+        rows = []
+        for (key, _), values in zip(batch, vectors):
+            vector = np.asarray(values, dtype=np.float32)
+            self._remember(key, vector)
+            self._inflight.pop(key).set_result(vector)
+            rows.append({"model": self.model, "key": key, "embedding": vector.astype(_STORED_DTYPE).tobytes()})
+
+        if await self._ensure_table():
+            try:
+                async with self.session_factory() as session:
+                    await session.execute(text("""
+                        INSERT INTO embedding_cache (model, text_hash, embedding)
+                        VALUES (:model, :key, :embedding)
+                        ON CONFLICT (model, text_hash) DO NOTHING
+                    """), rows)
+                    await session.commit()
+            except Exception:
+                logger.exception("Embedding cache store failed")
+
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "calls": self.calls,
+            "memory_entries": len(self._memory),
+        }
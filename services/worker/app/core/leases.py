@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import time
+import uuid
+from sqlalchemy import text
+from app.core.settings import settings
+from app.core.db import get_master_session
+
+logger = logging.getLogger("worker-leases")
+
+# Coordination tables live in the master DB and are owned by the worker.
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS worker_replicas (
+        worker_id TEXT PRIMARY KEY,
+        lease_group TEXT NOT NULL,
+        heartbeat_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS worker_leases (
+        lease_group TEXT NOT NULL,
+        tenant_id TEXT NOT NULL,
+        worker_id TEXT NOT NULL,
+        expires_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (lease_group, tenant_id)
+    )
+    """,
+]
+
+
+class LeaseManager:
+    """
+    Splits tenants between worker replicas with expiring leases in the master DB.
+
+    Every replica heartbeats into worker_replicas. On each cycle it keeps the
+    leases it holds, gives back any above its fair share (ceil(tenants / live
+    replicas)) and claims free or expired ones up to that share. A replica
+    that dies stops renewing, so its leases expire after LEASE_TTL_SECONDS and
+    are picked up by the survivors on their next rebalance, which callers run
+    at least every LEASE_TTL_SECONDS (see rebalance_due).
+    """
+
+    def __init__(self, lease_group: str):
+        self.lease_group = lease_group
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.owned = set()
+        self.acquired_at = None  # monotonic time of the last rebalance
+
+    def next_rebalance(self) -> float:
+        """Monotonic time by which acquire() should run again."""
+        if self.acquired_at is None:
+            return time.monotonic()
+        return self.acquired_at + settings.LEASE_TTL_SECONDS
+
+    def rebalance_due(self) -> bool:
+        return time.monotonic() >= self.next_rebalance()
+
+    async def setup(self):
+        async for session in get_master_session():
+            for stmt in DDL:
+                await session.execute(text(stmt))
+            await session.commit()
+
+    async def _heartbeat(self, session):
+        await session.execute(text("""
+            INSERT INTO worker_replicas (worker_id, lease_group, heartbeat_at)
+            VALUES (:worker_id, :group, now())
+            ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = now()
+        """), {"worker_id": self.worker_id, "group": self.lease_group})
+
+    async def _renew(self, session) -> set:
+        res = await session.execute(text("""
+            UPDATE worker_leases
+            SET expires_at = now() + make_interval(secs => :ttl)
+            WHERE lease_group = :group AND worker_id = :worker_id
+            RETURNING tenant_id
+        """), {"ttl": settings.LEASE_TTL_SECONDS, "group": self.lease_group, "worker_id": self.worker_id})
+        return {r.tenant_id for r in res.fetchall()}
+
+    async def acquire(self, session, tenant_ids: list[str]) -> set:
+        """Rebalances and returns the tenant ids this replica may process now."""
+        # Counted from the attempt, so a failing master DB is not retried in a tight loop
+        self.acquired_at = time.monotonic()
+        params = {"group": self.lease_group, "worker_id": self.worker_id}
+        await self._heartbeat(session)
+        await session.execute(text("""
+            DELETE FROM worker_replicas
+            WHERE heartbeat_at < now() - make_interval(secs => :ttl * 10)
+        """), {"ttl": settings.LEASE_TTL_SECONDS})
+
+        res = await session.execute(text("""
+            SELECT count(*) FROM worker_replicas
+            WHERE lease_group = :group
+              AND heartbeat_at > now() - make_interval(secs => :ttl)
+        """), {"group": self.lease_group, "ttl": settings.LEASE_TTL_SECONDS})
+        replicas = max(res.scalar() or 1, 1)
+        fair_share = math.ceil(len(tenant_ids) / replicas)
+
+        owned = await self._renew(session) & set(tenant_ids)
+
+        # Give back leases above the fair share (e.g. a new replica joined)
+        excess = sorted(owned)[fair_share:]
+        if excess:
+            await session.execute(text("""
+                DELETE FROM worker_leases
+                WHERE lease_group = :group AND worker_id = :worker_id
+                  AND tenant_id = ANY(CAST(:tenants AS text[]))
+            """), {**params, "tenants": excess})
+            owned -= set(excess)
+
+        need = fair_share - len(owned)
+        if need > 0:
+            res = await session.execute(text("""
+                SELECT tenant_id FROM worker_leases
+                WHERE lease_group = :group AND expires_at > now()
+            """), {"group": self.lease_group})
+            taken = {r.tenant_id for r in res.fetchall()}
+            candidates = [t for t in tenant_ids if t not in taken and t not in owned]
+            random.shuffle(candidates)
+
+            if candidates:
+                # Conditional upsert: only wins if the lease is free or expired,
+                # so two replicas racing for the same tenant cannot both get it.
+                res = await session.execute(text("""
+                    INSERT INTO worker_leases (lease_group, tenant_id, worker_id, expires_at)
+                    SELECT :group, t, :worker_id, now() + make_interval(secs => :ttl)
+                    FROM unnest(CAST(:tenants AS text[])) AS t
+                    ON CONFLICT (lease_group, tenant_id) DO UPDATE
+                    SET worker_id = EXCLUDED.worker_id, expires_at = EXCLUDED.expires_at
+                    WHERE worker_leases.expires_at < now()
+                    RETURNING tenant_id
+                """), {**params, "ttl": settings.LEASE_TTL_SECONDS, "tenants": candidates[:need]})
+                owned |= {r.tenant_id for r in res.fetchall()}
+
+        await session.commit()
+        if owned != self.owned:
+            logger.info(f"{self.worker_id} holds {len(owned)}/{len(tenant_ids)} tenants ({replicas} replicas)")
+        self.owned = owned
+        return owned
+
+    async def heartbeat_loop(self):
+        """
+        Keeps leases alive while long cycles run. `owned` is narrowed to the
+        leases actually renewed, so one taken over by another replica (e.g.
+        after a heartbeat outage outlived the TTL) stops being processed here.
+        """
+        interval = max(settings.LEASE_TTL_SECONDS / 3, 1)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async for session in get_master_session():
+                    await self._heartbeat(session)
+                    renewed = await self._renew(session)
+                    await session.commit()
+                lost = self.owned - renewed
+                if lost:
+                    logger.warning(f"{self.worker_id} lost {len(lost)} leases: {sorted(lost)}")
+                self.owned = self.owned & renewed
+            except Exception:
+                logger.exception("Lease heartbeat failed")
+
+    async def release(self):
+        try:
+            async for session in get_master_session():
+                await session.execute(text("""
+                    DELETE FROM worker_leases WHERE lease_group = :group AND worker_id = :worker_id
+                """), {"group": self.lease_group, "worker_id": self.worker_id})
+                await session.execute(text("""
+                    DELETE FROM worker_replicas WHERE worker_id = :worker_id
+                """), {"worker_id": self.worker_id})
+                await session.commit()
+        except Exception:
+            logger.exception("Failed to release leases")
+        self.owned = set()
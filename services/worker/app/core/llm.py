@@ -1,16 +1,34 @@
 from openai import AsyncAzureOpenAI
 from app.core.settings import settings
+from app.core.analysis_prompts import SUMMARY_MAX_COMPLETION_TOKENS, summary_messages
+from app.core.db import SessionLocal
+from app.core.embedding_cache import EmbeddingCache
+from app.core.rate_limit import LLMUnavailableError, RateLimitedClient
 import json
 import logging
+import numpy as np
 
 logger = logging.getLogger("worker-llm")
 
 client = AsyncAzureOpenAI(
     api_key=settings.AZURE_OPENAI_API_KEY,
     api_version=settings.AZURE_OPENAI_API_VERSION,
-    azure_endpoint=settings.AZURE_OPENAI_ENDPOINT
+    azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+    max_retries=0,  # retries are handled by RateLimitedClient
 )
 
+# Shared per deployment, so every caller in the process respects one quota
+chat_limiter = RateLimitedClient("chat", settings.LLM_RPM_LIMIT, settings.LLM_TPM_LIMIT)
+embedding_limiter = RateLimitedClient("embeddings", settings.EMBEDDING_RPM_LIMIT, settings.EMBEDDING_TPM_LIMIT)
+
+
+async def _chat(messages: list[dict], **kwargs):
+    estimated = sum(estimate_tokens(m["content"]) for m in messages) + settings.LLM_COMPLETION_TOKEN_ESTIMATE
+    return await chat_limiter.call(
+        client.chat.completions.create, estimated,
+        model=settings.MODEL_NAME, messages=messages, **kwargs
+    )
+
 SYSTEM_PROMPT = """
 You are an expert social media sentiment analyst. 
 Analyze the following text and extract:
@@ -21,21 +39,182 @@ Analyze the following text and extract:
 Return the result as a valid JSON object with keys: "sentiment", "emotion", "confidence".
 """
 
-async def analyze_sentiment(text: str) -> dict:
+async def analyze_sentiment(text: str, stats: dict | None = None) -> dict | None:
+    """
+    Returns the sentiment result, or None if the text could not be classified.
+    Raises LLMUnavailableError when the rate limit is exhausted.
+    """
     try:
-        response = await client.chat.completions.create(
-            model=settings.MODEL_NAME,
-            messages=[
+        response = await _chat(
+            [
                 {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": f"Text: {text}"}
             ],
             response_format={"type": "json_object"}
         )
-        content = response.choices[0].message.content
-        return json.loads(content)
+        _record_usage(response, 1, stats)
+        result = json.loads(response.choices[0].message.content)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
         logger.error(f"LLM analysis failed: {e}")
-        return {"sentiment": "neutral", "emotion": "unknown", "confidence": 0.0, "error": str(e)}
+        return None
+    if not _valid_result(result):
+        logger.error(f"LLM returned an invalid sentiment result: {result}")
+        return None
+    return {
+        "sentiment": result["sentiment"],
+        "emotion": result.get("emotion"),
+        "confidence": float(result["confidence"]),
+    }
+
+BATCH_SYSTEM_PROMPT = """
+You are an expert social media sentiment analyst.
+You will receive a JSON array of items, each with an "interaction_id" and a "text".
+For EVERY item extract:
+1. Sentiment: strictly 'positive', 'neutral', or 'negative'.
+2. Emotion: one word describing the emotion (e.g., trust, excitement, frustration, anger, joy).
+3. Confidence: a float between 0.0 and 1.0.
+
+Return a valid JSON object of the form:
+{"results": [{"interaction_id": "...", "sentiment": "...", "emotion": "...", "confidence": 0.0}, ...]}
+with exactly one entry per input item, using the interaction_id values unchanged.
+"""
+
+SENTIMENTS = ("positive", "neutral", "negative")
+
+
+def new_usage() -> dict:
+    return {"calls": 0, "items": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+
+# Process-wide totals for sentiment calls
+usage = new_usage()
+
+
+def _record_usage(response, items: int, stats: dict | None = None):
+    for counters in (usage, stats) if stats is not None else (usage,):
+        counters["calls"] += 1
+        counters["items"] += items
+        if getattr(response, "usage", None):
+            counters["prompt_tokens"] += response.usage.prompt_tokens or 0
+            counters["completion_tokens"] += response.usage.completion_tokens or 0
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for packing decisions
+    return len(text) // 4 + 1
+
+
+def chunk_text(text: str, max_tokens: int) -> list[str]:
+    """
+    Splits text into pieces of at most ~max_tokens, on line boundaries where
+    possible. Lines longer than the budget are cut by characters.
+    """
+    max_chars = max_tokens * 4
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        while len(line) > max_chars:
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and size + len(line) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return [c for c in chunks if c.strip()]
+
+
+def pack_batches(items: list[tuple[str, str]]) -> list[list[tuple[str, str]]]:
+    """Groups (interaction_id, text) pairs into batches bounded by count and token budget."""
+    batches, current, tokens = [], [], 0
+    for item in items:
+        cost = estimate_tokens(item[1]) + 20  # per-item JSON overhead
+        if current and (
+            len(current) >= settings.SENTIMENT_BATCH_SIZE
+            or tokens + cost > settings.SENTIMENT_BATCH_MAX_TOKENS
+        ):
+            batches.append(current)
+            current, tokens = [], 0
+        current.append(item)
+        tokens += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _valid_result(r) -> bool:
+    if not isinstance(r, dict) or r.get("sentiment") not in SENTIMENTS:
+        return False
+    try:
+        return 0.0 <= float(r.get("confidence", -1)) <= 1.0
+    except (TypeError, ValueError):
+        return False
+
+
+async def analyze_sentiment_batch(
+    items: list[tuple[str, str]], stats: dict | None = None, unavailable: set | None = None
+) -> dict:
+    """
+    Classifies several (interaction_id, text) pairs in one chat completion.
+    Returns {interaction_id: result}. Items missing or invalid in the model's
+    answer are retried by splitting the batch in half, down to single-item
+    analyze_sentiment calls. Items that still fail are left out; those that
+    hit an exhausted rate limit are also added to `unavailable`, since only
+    they are worth retrying later.
+    """
+    if len(items) == 1:
+        try:
+            result = await analyze_sentiment(items[0][1], stats)
+        except LLMUnavailableError as e:
+            logger.error(f"LLM analysis gave up: {e}")
+            if unavailable is not None:
+                unavailable.add(items[0][0])
+            return {}
+        return {items[0][0]: result} if result is not None else {}
+
+    results = {}
+    try:
+        response = await _chat(
+            [
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": json.dumps(
+                    [{"interaction_id": i, "text": t} for i, t in items], ensure_ascii=False
+                )}
+            ],
+            response_format={"type": "json_object"}
+        )
+        _record_usage(response, len(items), stats)
+        parsed = json.loads(response.choices[0].message.content).get("results", [])
+        wanted = {i for i, _ in items}
+        for r in parsed if isinstance(parsed, list) else []:
+            if _valid_result(r) and str(r.get("interaction_id")) in wanted:
+                results[str(r["interaction_id"])] = {
+                    "sentiment": r["sentiment"],
+                    "emotion": r.get("emotion"),
+                    "confidence": float(r["confidence"]),
+                }
+    except LLMUnavailableError as e:
+        # Splitting would only multiply throttled calls; give the items back
+        logger.error(f"Batch LLM analysis gave up on {len(items)} items: {e}")
+        if unavailable is not None:
+            unavailable.update(i for i, _ in items)
+        return results
+    except Exception as e:
+        logger.error(f"Batch LLM analysis failed for {len(items)} items: {e}")
+
+    missing = [item for item in items if item[0] not in results]
+    if missing:
+        if len(missing) < len(items):
+            logger.warning(f"Batch answer incomplete: retrying {len(missing)}/{len(items)} items")
+        # Partial answer: retry just the gaps. Total failure: split in half.
+        mid = (len(missing) + 1) // 2
+        retries = [missing] if len(missing) < len(items) else [missing[:mid], missing[mid:]]
+        for retry in retries:
+            results.update(await analyze_sentiment_batch(retry, stats, unavailable))
+    return results
 
 SUMMARY_PROMPT = """
 You are a senior data analyst. 
@@ -61,40 +240,84 @@ Maintain a professional and insightful tone.
 
 async def generate_detailed_summary(change_data: str) -> str:
     try:
-        response = await client.chat.completions.create(
-            model=settings.MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SUMMARY_PROMPT},
-                {"role": "user", "content": f"Analyze these changes:\n{change_data}"}
-            ]
-        )
+        response = await _chat([
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Analyze these changes:\n{change_data}"}
+        ])
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Summary generation failed: {e}")
         return f"Error generating summary: {str(e)}"
 
-async def generate_table_summary(table_name: str, change_data: str) -> str:
+async def generate_table_summary(table_name: str, change_data: str) -> str | None:
+    """Summarizes one table's changes with TABLE_SUMMARY_PROMPT; None on failure."""
     try:
-        response = await client.chat.completions.create(
-            model=settings.MODEL_NAME,
-            messages=[
-                {"role": "system", "content": TABLE_SUMMARY_PROMPT},
-                {"role": "user", "content": f"Table: {table_name}\nChanges:\n{change_data}"}
-            ]
-        )
+        response = await _chat([
+            {"role": "system", "content": TABLE_SUMMARY_PROMPT},
+            {"role": "user", "content": f"Table: {table_name}\nChanges:\n{change_data}"}
+        ])
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"Table summary failed for {table_name}: {e}")
-        return f"Error summarizing {table_name}: {str(e)}"
+        return None
+
+async def generate_collated_summary(summaries: list[str]) -> str | None:
+    """Merges several partial summaries into one with COLLATE_PROMPT; None on failure."""
+    try:
+        response = await _chat([
+            {"role": "system", "content": COLLATE_PROMPT},
+            {"role": "user", "content": "\n\n".join(summaries)}
+        ])
+        return response.choices[0].message.content
+    except Exception as e:
+        logger.error(f"Summary collation failed for {len(summaries)} parts: {e}")
+        return None
+
+async def generate_analysis_summary(content: str, instruction: str) -> str:
+    """One /analysis/summarize completion (background job). Raises on failure."""
+    response = await _chat(summary_messages(content, instruction), max_completion_tokens=SUMMARY_MAX_COMPLETION_TOKENS)
+    return response.choices[0].message.content
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+async def _create_embeddings(texts: list[str]) -> list[list[float]]:
+    response = await embedding_limiter.call(
+        client.embeddings.create, sum(estimate_tokens(t) for t in texts),
+        model=EMBEDDING_MODEL,
+        input=texts
+    )
+    return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+# Identical texts (and chunks) are embedded once; concurrent misses from all
+# tenants are batched into shared embeddings calls
+embedding_cache = EmbeddingCache(
+    model=EMBEDDING_MODEL,
+    create=_create_embeddings,
+    session_factory=SessionLocal,
+    memory_size=settings.EMBEDDING_CACHE_SIZE,
+    db_enabled=settings.EMBEDDING_CACHE_DB_ENABLED,
+    max_inputs=settings.EMBEDDING_BATCH_MAX_INPUTS,
+    max_tokens=settings.EMBEDDING_BATCH_MAX_TOKENS,
+    batch_window_seconds=settings.EMBEDDING_BATCH_WINDOW_MS / 1000,
+)
 
 async def generate_embeddings(text: str) -> list[float]:
+    """
+    Embeds text of any length: it is split into EMBEDDING_CHUNK_TOKENS chunks
+    (looked up in / added to the embedding cache) and the chunk vectors are
+    averaged, weighted by length, and re-normalized. Returns [] on failure.
+    """
+    chunks = chunk_text(text, settings.EMBEDDING_CHUNK_TOKENS)
+    if not chunks:
+        return []
     try:
-        response = await client.embeddings.create(
-            model="text-embedding-3-large",
-            input=text
-        )
-        return response.data[0].embedding
+        vectors = await embedding_cache.embed(chunks)
     except Exception as e:
-        logger.error(f"Embedding generation failed: {e}")
+        logger.error(f"Embedding generation failed for {len(chunks)} chunks: {e}")
         return []
 
+    if len(vectors) == 1:
+        return vectors[0].tolist()
+    mean = np.average(np.stack(vectors), axis=0, weights=[len(c) for c in chunks])
+    return (mean / (np.linalg.norm(mean) or 1.0)).tolist()
+
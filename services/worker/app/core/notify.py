@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import asyncpg
+
+logger = logging.getLogger("worker-notify")
+
+# Must match app/core/notify.py in the API. Payload is "<schema>.<table>".
+INGEST_CHANNEL = "raw_ingest"
+# Payload is the schema that queued a background analysis job
+JOBS_CHANNEL = "analysis_jobs"
+# Payload is a schema whose tables/columns changed (bootstrap, dbt run)
+SCHEMA_CHANNEL = "schema_changed"
+
+
+class IngestListener:
+    """
+    Holds one LISTEN connection per shard and collects the tenants that
+    received new rows in any of `tables`. The worker drains them with take()
+    and only queries those tenants. On a `channel` other than raw_ingest the
+    payload is the schema itself and `tables` is not used.
+
+    If a listening connection drops, notifications may have been lost, so
+    `missed` is set and the worker falls back to a full scan.
+
+    With on_schema_change, schema_changed notifications are passed on as
+    on_schema_change(schema), and as on_schema_change(None) after a dropped
+    connection.
+    """
+
+    def __init__(self, tables: tuple[str, ...], on_schema_change=None, channel: str = INGEST_CHANNEL):
+        self.tables = set(tables)
+        self.channel = channel
+        self.on_schema_change = on_schema_change
+        self.dirty = set()
+        self.missed = False
+        self._event = asyncio.Event()
+        self._conns = {}  # shard key -> asyncpg connection
+
+    @staticmethod
+    def _shard_key(cfg: dict) -> str:
+        return cfg.get("shard_id") or f"{cfg['host']}:{cfg['port']}:{cfg['db_name']}"
+
+    def _on_notify(self, conn, pid, channel, payload):
+        schema, _, table = payload.partition(".")
+        if channel != INGEST_CHANNEL or table in self.tables:
+            self.dirty.add(schema)
+            self._event.set()
+
+    def _on_schema_notify(self, conn, pid, channel, payload):
+        self.on_schema_change(payload)
+
+    def _on_terminate(self, key):
+        def callback(conn):
+            if self._conns.get(key) is not conn:
+                return  # closed on purpose by sync()/close()
+            logger.warning(f"LISTEN connection to shard {key} closed")
+            del self._conns[key]
+            self.missed = True
+            if self.on_schema_change:
+                self.on_schema_change(None)
+            self._event.set()
+        return callback
+
+    async def sync(self, tenants: list[dict]):
+        """Opens a LISTEN connection for every shard that is not listened on yet."""
+        shards = {self._shard_key(t): t for t in tenants}
+        for key, cfg in shards.items():
+            if key in self._conns:
+                continue
+            try:
+                conn = await asyncpg.connect(
+                    host=cfg["host"], port=cfg["port"], database=cfg["db_name"],
+                    user=cfg["user"], password=cfg["password"],
+                )
+                await conn.add_listener(self.channel, self._on_notify)
+                if self.on_schema_change:
+                    await conn.add_listener(SCHEMA_CHANNEL, self._on_schema_notify)
+                conn.add_termination_listener(self._on_terminate(key))
+                self._conns[key] = conn
+                logger.info(f"Listening on {self.channel} for shard {key}")
+            except Exception:
+                logger.exception(f"Failed to LISTEN on shard {key}")
+                self.missed = True
+
+        for key in set(self._conns) - set(shards):
+            await self._conns.pop(key).close()
+
+    def take(self) -> set:
+        """Returns and clears the tenants notified since the last call."""
+        dirty, self.dirty = self.dirty, set()
+        self._event.clear()
+        return dirty
+
+    def mark(self, tenant_ids):
+        """Queues tenants for another cycle without waiting for a notification."""
+        if tenant_ids:
+            self.dirty.update(tenant_ids)
+            self._event.set()
+
+    async def wait(self, timeout: float) -> bool:
+        """Waits until a tenant is notified (True) or the timeout expires (False)."""
+        try:
+            await asyncio.wait_for(self._event.wait(), max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def close(self):
+        conns, self._conns = self._conns, {}
+        for conn in conns.values():
+            await conn.close()
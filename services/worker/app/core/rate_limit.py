@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import random
+import time
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from app.core.settings import settings
+
+logger = logging.getLogger("worker-ratelimit")
+
+RETRYABLE = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when a call still fails after LLM_MAX_RETRIES throttled/transient attempts."""
+
+
+class TokenBucket:
+    """
+    Refills continuously at per_minute / 60 units per second, holding at most
+    burst_seconds worth. Requests larger than the capacity wait for a full
+    bucket instead of blocking forever.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount: float):
+        """Charges (or refunds, if negative) the difference between estimated and actual usage."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self):
+        """Empties the bucket after a 429 so the next callers wait for a refill."""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limit: +1 slot after every `limit` successes in a
+    row (additive increase), halved on throttling (multiplicative decrease).
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    async def on_success(self):
+        async with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify_all()
+
+    async def on_throttle(self):
+        async with self._cond:
+            new_limit = max(self.minimum, self.limit // 2)
+            if new_limit < self.limit:
+                logger.warning(f"Throttled: LLM concurrency {self.limit} -> {new_limit}")
+            self.limit = new_limit
+            self._successes = 0
+
+
+def _retry_after(error) -> float | None:
+    """Reads Retry-After (seconds) or Azure's retry-after-ms from a throttled response."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _backoff(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    ceiling = min(settings.LLM_BACKOFF_MAX_SECONDS, settings.LLM_BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+class RateLimitedClient:
+    """
+    Shared wrapper around one Azure OpenAI deployment: every call waits for a
+    request slot (RPM bucket), its estimated tokens (TPM bucket) and an AIMD
+    concurrency slot. Throttled and transient failures are retried with
+    Retry-After-aware exponential backoff; after LLM_MAX_RETRIES the call
+    raises LLMUnavailableError so the caller can re-queue its items.
+    """
+
+    def __init__(self, name: str, rpm: int, tpm: int):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AIMDLimiter(
+            initial=max(settings.MAX_CONCURRENT_REQUESTS // 2, settings.LLM_MIN_CONCURRENCY),
+            minimum=settings.LLM_MIN_CONCURRENCY,
+            maximum=settings.MAX_CONCURRENT_REQUESTS,
+        )
+        self.throttled = 0
+
+    async def call(self, fn, estimated_tokens: int, **kwargs):
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            await self.requests.acquire()
+            await self.tokens.acquire(estimated_tokens)
+            try:
+                async with self.concurrency:
+                    response = await fn(**kwargs)
+            except RETRYABLE as e:
+                if attempt == settings.LLM_MAX_RETRIES:
+                    raise LLMUnavailableError(f"{self.name}: {e}") from e
+                delay = _backoff(attempt)
+                if isinstance(e, RateLimitError):
+                    self.throttled += 1
+                    self.tokens.drain()
+                    await self.concurrency.on_throttle()
+                    delay = max(delay, _retry_after(e) or 0.0)
+                logger.warning(
+                    f"{self.name} call failed ({type(e).__name__}), "
+                    f"retry {attempt + 1}/{settings.LLM_MAX_RETRIES} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            await self.concurrency.on_success()
+            used = getattr(getattr(response, "usage", None), "total_tokens", None)
+            if used:
+                self.tokens.adjust(used - estimated_tokens)
+            return response
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency.limit,
+            "in_flight": self.concurrency.in_flight,
+            "throttled": self.throttled,
+        }
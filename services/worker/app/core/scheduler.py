@@ -0,0 +1,81 @@
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable, Callable
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing of LLM work across tenants.
+
+    Each job gets a virtual finish tag of max(virtual time, tenant's last tag)
+    + cost / weight and jobs start in tag order, so a tenant with one small
+    batch is served next even while a large tenant has hundreds queued. At
+    most `slots()` jobs run at once (the adaptive LLM concurrency limit) and
+    at most `per_tenant_cap` per tenant. The queue is work-conserving: slots
+    a tenant cannot use go to the others.
+    """
+
+    def __init__(self, slots: Callable[[], int], per_tenant_cap: int):
+        self._slots = slots
+        self.per_tenant_cap = per_tenant_cap
+        self._queue = []  # heap of (finish_tag, seq, tenant, future)
+        self._seq = itertools.count()
+        self._finish = {}  # tenant -> finish tag of its last queued job
+        self._pending = {}  # tenant -> jobs queued or running
+        self._inflight = {}  # tenant -> running jobs
+        self._running = 0
+        self._vtime = 0.0
+
+    async def run(self, tenant: str, cost: float, weight: float, fn: Callable[[], Awaitable]):
+        tag = max(self._vtime, self._finish.get(tenant, 0.0)) + cost / max(weight, 1e-9)
+        self._finish[tenant] = tag
+        self._pending[tenant] = self._pending.get(tenant, 0) + 1
+        granted = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (tag, next(self._seq), tenant, granted))
+        try:
+            self._dispatch()
+            try:
+                await granted
+            except asyncio.CancelledError:
+                if granted.done() and not granted.cancelled():
+                    self._release(tenant)
+                raise
+            try:
+                return await fn()
+            finally:
+                self._release(tenant)
+        finally:
+            # An idle tenant's last tag is at most the virtual time (or
+            # belongs to a cancelled job), so forgetting it changes nothing
+            self._pending[tenant] -= 1
+            if not self._pending[tenant]:
+                del self._pending[tenant]
+                del self._finish[tenant]
+
+    def _release(self, tenant: str):
+        self._running -= 1
+        self._inflight[tenant] -= 1
+        if not self._inflight[tenant]:
+            del self._inflight[tenant]
+        self._dispatch()
+
+    def _dispatch(self):
+        capped = []
+        while self._queue and self._running < max(self._slots(), 1):
+            entry = heapq.heappop(self._queue)
+            tag, _, tenant, granted = entry
+            if granted.done():  # waiter was cancelled
+                continue
+            if self._inflight.get(tenant, 0) >= self.per_tenant_cap:
+                capped.append(entry)
+                continue
+            self._vtime = max(self._vtime, tag)
+            self._running += 1
+            self._inflight[tenant] = self._inflight.get(tenant, 0) + 1
+            granted.set_result(None)
+        for entry in capped:
+            heapq.heappush(self._queue, entry)
+
+    def stats(self) -> dict:
+        return {"running": self._running, "queued": len(self._queue), "tenants": len(self._inflight)}
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import re
+import unicodedata
+from collections import OrderedDict
+from sqlalchemy import text
+from app.core.settings import settings
+from app.core.db import get_master_session
+
+logger = logging.getLogger("sentiment-cache")
+
+# Shared across tenants, so it lives in the master DB. Only the text hash is
+# stored, never the text itself.
+DDL = """
+    CREATE TABLE IF NOT EXISTS sentiment_cache (
+        text_hash TEXT NOT NULL,
+        model_version TEXT NOT NULL,
+        sentiment TEXT NOT NULL,
+        emotion TEXT,
+        confidence FLOAT,
+        created_at TIMESTAMP DEFAULT now(),
+        PRIMARY KEY (text_hash, model_version)
+    )
+"""
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def text_key(text_content: str) -> str:
+    normalized = unicodedata.normalize("NFKC", text_content)
+    normalized = _WHITESPACE.sub(" ", normalized).strip().lower()
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class SentimentCache:
+    """
+    Sentiment results keyed by (normalized-text hash, MODEL_NAME), with an
+    in-process LRU in front of the master-DB sentiment_cache table. Repeated
+    texts ("great post!", emoji replies, reposted captions) are classified
+    once across tenants and re-runs.
+    """
+
+    def __init__(self):
+        self._memory = OrderedDict()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    async def setup(self):
+        if not settings.SENTIMENT_CACHE_DB_ENABLED:
+            return
+        async for session in get_master_session():
+            await session.execute(text(DDL))
+            await session.commit()
+
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        if len(self._memory) > settings.SENTIMENT_CACHE_SIZE:
+            self._memory.popitem(last=False)
+
+    async def lookup(self, items: list[tuple[str, str]]) -> tuple[dict, dict]:
+        """
+        Splits (interaction_id, text) pairs into cached results
+        ({interaction_id: result}) and cache misses grouped by text key
+        ({key: [(interaction_id, text), ...]}), so each distinct text is
+        classified only once.
+        """
+        found, pending = {}, {}
+        for interaction_id, text_content in items:
+            key = text_key(text_content)
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[interaction_id] = self._memory[key]
+                self.memory_hits += 1
+            else:
+                pending.setdefault(key, []).append((interaction_id, text_content))
+
+        if pending and settings.SENTIMENT_CACHE_DB_ENABLED:
+            try:
+                async for session in get_master_session():
+                    res = await session.execute(text("""
+                        SELECT text_hash, sentiment, emotion, confidence
+                        FROM sentiment_cache
+                        WHERE model_version = :model AND text_hash = ANY(CAST(:keys AS text[]))
+                    """), {"model": settings.MODEL_NAME, "keys": list(pending)})
+                    for row in res.fetchall():
+                        result = {"sentiment": row.sentiment, "emotion": row.emotion, "confidence": row.confidence}
+                        self._remember(row.text_hash, result)
+                        group = pending.pop(row.text_hash)
+                        for interaction_id, _ in group:
+                            found[interaction_id] = result
+                        self.db_hits += len(group)
+            except Exception:
+                logger.exception("Sentiment cache lookup failed")
+
+        self.misses += sum(len(group) for group in pending.values())
+        return found, pending
+
+    async def store(self, results: dict):
+        """Caches {text key: result} for freshly classified texts."""
+        if not results:
+            return
+        for key, result in results.items():
+            self._remember(key, result)
+
+        if not settings.SENTIMENT_CACHE_DB_ENABLED:
+            return
+        try:
+            async for session in get_master_session():
+                await session.execute(text("""
+                    INSERT INTO sentiment_cache (text_hash, model_version, sentiment, emotion, confidence)
+                    VALUES (:key, :model, :sentiment, :emotion, :conf)
+                    ON CONFLICT (text_hash, model_version) DO NOTHING
+                """), [
+                    {
+                        "key": key,
+                        "model": settings.MODEL_NAME,
+                        "sentiment": r.get("sentiment", "neutral"),
+                        "emotion": r.get("emotion"),
+                        "conf": r.get("confidence", 0.0),
+                    }
+                    for key, r in results.items()
+                ])
+                await session.commit()
+        except Exception:
+            logger.exception("Sentiment cache store failed")
+
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.db_hits + self.misses
+        return (self.memory_hits + self.db_hits) / total if total else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate(), 4),
+            "memory_entries": len(self._memory),
+        }
@@ -13,7 +13,96 @@ class Settings(BaseSettings):
     MAX_CONCURRENT_TENANTS: int = 5
     MAX_CONCURRENT_REQUESTS: int = 20
     POLL_INTERVAL_SECONDS: int = 10
+    # Wake on NOTIFY raw_ingest from the API; full scans then only run every
+    # FALLBACK_POLL_INTERVAL_SECONDS (POLL_INTERVAL_SECONDS when disabled)
+    NOTIFY_ENABLED: bool = True
+    FALLBACK_POLL_INTERVAL_SECONDS: int = 300
+    NOTIFY_DEBOUNCE_SECONDS: float = 0.5
     BATCH_SIZE: int = 50
+    # Interactions packed into one sentiment LLM call (1 disables batching)
+    SENTIMENT_BATCH_SIZE: int = 20
+    # Estimated input-token budget per packed sentiment call
+    SENTIMENT_BATCH_MAX_TOKENS: int = 4000
+    # Sentiment result cache: in-process LRU entries + shared master-DB tier
+    SENTIMENT_CACHE_SIZE: int = 50000
+    SENTIMENT_CACHE_DB_ENABLED: bool = True
+    # Max sentiment_results rows written per upsert statement
+    SENTIMENT_FLUSH_SIZE: int = 500
+    # ...or after this many seconds, whichever comes first
+    SENTIMENT_FLUSH_INTERVAL_SECONDS: float = 1.0
+    # Interactions that could not be classified go to sentiment_failures and
+    # are retried after base * 2^(attempt - 1) seconds (capped), up to
+    # SENTIMENT_MAX_ATTEMPTS attempts; after that they stay there, dead-lettered
+    SENTIMENT_MAX_ATTEMPTS: int = 5
+    SENTIMENT_RETRY_BASE_SECONDS: float = 60.0
+    SENTIMENT_RETRY_MAX_SECONDS: float = 3600.0
+    # Max pages waiting between pipeline stages
+    PIPELINE_QUEUE_SIZE: int = 20
+    # Backlog scheduling: pages of BATCH_SIZE one tenant may take per cycle,
+    # and sentiment LLM batches it may have in flight at once
+    TENANT_MAX_PAGES_PER_CYCLE: int = 10
+    TENANT_MAX_CONCURRENT_BATCHES: int = 8
+
+    # LLM quota (per deployment, as configured in Azure) and retry policy.
+    # MAX_CONCURRENT_REQUESTS is the ceiling for the adaptive concurrency limit.
+    LLM_RPM_LIMIT: int = 300
+    LLM_TPM_LIMIT: int = 100000
+    EMBEDDING_RPM_LIMIT: int = 300
+    EMBEDDING_TPM_LIMIT: int = 200000
+    LLM_MIN_CONCURRENCY: int = 1
+    LLM_MAX_RETRIES: int = 5
+    LLM_BACKOFF_BASE_SECONDS: float = 1.0
+    LLM_BACKOFF_MAX_SECONDS: float = 60.0
+    # Completion tokens reserved per call when charging the TPM bucket
+    LLM_COMPLETION_TOKEN_ESTIMATE: int = 200
+
+    # SummaryWorker: runs next to the sentiment worker every
+    # SUMMARY_INTERVAL_SECONDS; table-summary LLM calls in flight across tenants.
+    # With LEASES_ENABLED replicas split tenants ("summary" lease group);
+    # without leases, enable it on exactly one replica.
+    SUMMARY_ENABLED: bool = True
+    SUMMARY_INTERVAL_SECONDS: int = 3600
+    SUMMARY_MAX_CONCURRENT_TABLES: int = 5
+    # Cached tables/columns per schema; also dropped on schema_changed NOTIFY
+    SCHEMA_CATALOG_TTL_SECONDS: int = 900
+    # Changed rows aggregated per table per run (the rest follow next run),
+    # and top values reported per low-cardinality column
+    SUMMARY_MAX_ROWS_PER_TABLE: int = 5000
+    SUMMARY_TOP_N: int = 5
+    SUMMARY_TOP_N_MAX_DISTINCT: int = 50
+    # Map-reduce budgets (estimated tokens): input per table-summary call,
+    # partial summaries per collate call, and text per embedding input
+    SUMMARY_CHUNK_TOKENS: int = 3000
+    SUMMARY_REDUCE_MAX_TOKENS: int = 6000
+    EMBEDDING_CHUNK_TOKENS: int = 6000
+    # Embedding cache (in-process LRU + shared master-DB tier) and batching:
+    # cache misses arriving within the window share one embeddings call of
+    # at most MAX_INPUTS texts (the API's input-array limit) / MAX_TOKENS
+    EMBEDDING_CACHE_SIZE: int = 2000
+    EMBEDDING_CACHE_DB_ENABLED: bool = True
+    EMBEDDING_BATCH_MAX_INPUTS: int = 2048
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100000
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0
+
+    # Background /analysis/summarize jobs: jobs in flight per worker, budget
+    # per attempt (running jobs older than this are reclaimed), attempts
+    ANALYSIS_JOBS_ENABLED: bool = True
+    ANALYSIS_JOB_CONCURRENCY: int = 4
+    ANALYSIS_JOB_TIMEOUT_SECONDS: int = 600
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = 3
+    # A failed attempt is retried after base * 2^(attempt - 1) seconds, capped
+    ANALYSIS_JOB_RETRY_BASE_SECONDS: float = 30.0
+    ANALYSIS_JOB_RETRY_MAX_SECONDS: float = 900.0
+
+    # Tenant registry / per-shard pools
+    TENANT_REGISTRY_TTL_SECONDS: int = 60
+    TENANT_POOL_MIN_SIZE: int = 5
+    TENANT_POOL_MAX_SIZE: int = 30
+    TENANT_POOL_CONNECTIONS_PER_TENANT: float = 0.5
+
+    # Tenant leases between worker replicas (master DB)
+    LEASES_ENABLED: bool = True
+    LEASE_TTL_SECONDS: int = 60
 
     class Config:
         env_file = ".env"
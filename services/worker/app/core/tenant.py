@@ -1,16 +1,92 @@
+import asyncio
 import logging
+import math
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import ProgrammingError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
+from app.core.settings import settings
+from app.core.vector import install_vector_codec
 
 logger = logging.getLogger("worker-tenant")
 
+DEFAULT_SHARD_ID = "default"
+
+_REGISTRY_QUERY = text("""
+    SELECT
+        r.tenant_id,
+        s.shard_id,
+        s.host,
+        s.port,
+        s.db_name,
+        s.db_user,
+        s.db_password,
+        r.is_active
+    FROM tenant_registry r
+    JOIN tenant_shards s ON s.shard_id = r.shard_id
+""")
+
+# (expires_at, tenants) — the tenant list is re-read at most once per TTL
+_TENANT_CACHE = (0.0, [])
+# shard key -> active tenants on it, as of the last registry read
+_SHARD_TENANTS = {}
+
+
+def shard_key(cfg: dict) -> str:
+    return cfg.get("shard_id") or f"{cfg['host']}:{cfg['port']}:{cfg['db_name']}"
+
+
+def default_shard_cfg(tenant_count=None) -> dict:
+    # Unregistered tenants live on the same instance as the master DB.
+    url = make_url(settings.MASTER_DB_URL)
+    return {
+        "shard_id": DEFAULT_SHARD_ID,
+        "host": url.host,
+        "port": url.port or 5432,
+        "db_name": url.database,
+        "user": url.username,
+        "password": url.password,
+        "tenant_count": tenant_count,
+    }
+
+
 async def get_all_tenants(master_session):
     """
-    Fetches all active tenant details by scanning schemas starting with 'org_'.
-    Since all tenants share the same remote database, the host/user etc are the same.
+    Fetches all active tenants with the connection config of the shard that
+    holds each one. Registered tenants come from the master-DB tenant_registry;
+    any other 'org_' schema found on the master instance is routed to the
+    default shard. Deactivated tenants are left out, including a schema of
+    theirs left behind on the master. Each entry carries the number of
+    active tenants on its shard (tenant_count, which sizes the shard's pool).
+    Results are cached for TENANT_REGISTRY_TTL_SECONDS.
     """
+    global _TENANT_CACHE, _SHARD_TENANTS
+    expires_at, cached = _TENANT_CACHE
+    if cached and expires_at > time.monotonic():
+        return cached
+
     try:
+        tenants, registered = {}, set()
+        try:
+            result = await master_session.execute(_REGISTRY_QUERY)
+            for row in result.fetchall():
+                registered.add(row.tenant_id.strip().lower())
+                if not row.is_active:
+                    continue
+                tenants[row.tenant_id] = {
+                    "tenant_id": row.tenant_id,
+                    "shard_id": row.shard_id,
+                    "host": row.host,
+                    "port": row.port,
+                    "db_name": row.db_name,
+                    "user": row.db_user,
+                    "password": row.db_password,
+                }
+        except ProgrammingError:
+            logger.warning("tenant_registry not found in master DB; using default shard")
+            await master_session.rollback()
+
         # Scan information_schema for schemas starting with 'org_'
         query = text("""
             SELECT schema_name 
@@ -18,36 +94,58 @@ async def get_all_tenants(master_session):
             WHERE schema_name LIKE 'org_%'
         """)
         result = await master_session.execute(query)
-        schemas = [row.schema_name for row in result.fetchall()]
-        
-        # We need to return the full config for each tenant
-        # Since they are all in the same DB, we use the master connection info
-        # The user provided these Production credentials:
-        # Host: 66.135.22.167 Port: 5432 Username: postgres Password: galaxiq
-        
-        return [
-            {
-                "tenant_id": s,
-                "host": "66.135.22.167",
-                "port": 5432,
-                "db_name": "galaxiq_tenants",
-                "user": "postgres",
-                "password": "galaxiq"
-            }
-            for s in schemas
-        ]
+        unregistered = [row.schema_name for row in result.fetchall() if row.schema_name not in registered]
+
+        default_cfg = default_shard_cfg()
+        for s in unregistered:
+            tenants[s] = {**default_cfg, "tenant_id": s}
+
+        counts = {}
+        for t in tenants.values():
+            counts[shard_key(t)] = counts.get(shard_key(t), 0) + 1
+        tenant_list = [{**t, "tenant_count": counts[shard_key(t)]} for t in tenants.values()]
+        _SHARD_TENANTS = counts
+        _TENANT_CACHE = (time.monotonic() + settings.TENANT_REGISTRY_TTL_SECONDS, tenant_list)
+        return tenant_list
     except Exception:
         logger.exception("Failed to fetch tenants from schemas")
-        return []
+        return cached
+
+def invalidate_tenants():
+    """Forces the next get_all_tenants call to re-read the registry."""
+    global _TENANT_CACHE
+    _TENANT_CACHE = (0.0, _TENANT_CACHE[1])
+
+_POOLS = {}  # shard key -> (engine, pool_size)
+_RETIRED = set()  # dispose() tasks of replaced engines
 
-_POOLS = {}
+def pool_size_for(tenant_count):
+    # Grow the pool with the number of tenants on the shard, within bounds.
+    if not tenant_count:
+        return settings.TENANT_POOL_MIN_SIZE
+    wanted = math.ceil(tenant_count * settings.TENANT_POOL_CONNECTIONS_PER_TENANT)
+    return max(settings.TENANT_POOL_MIN_SIZE, min(settings.TENANT_POOL_MAX_SIZE, wanted))
 
 def get_engine(cfg):
     url = f"postgresql+asyncpg://{cfg['user']}:{cfg['password']}@{cfg['host']}:{cfg['port']}/{cfg['db_name']}"
-    key = f"{cfg['host']}:{cfg['port']}:{cfg['db_name']}"
-    if key not in _POOLS:
-        _POOLS[key] = create_async_engine(url, pool_size=5, max_overflow=10)
-    return _POOLS[key]
+    key = shard_key(cfg)
+    # The latest registry read wins over the count in an older tenant dict
+    pool_size = pool_size_for(_SHARD_TENANTS.get(key, cfg.get("tenant_count")))
+    current = _POOLS.get(key)
+    if current is None or current[1] != pool_size:
+        if current is None:
+            logger.info(f"Creating pool for shard {key} (pool_size={pool_size})")
+        else:
+            # Tenants moved to or from the shard. Sessions still open on the
+            # old engine keep their connection until they close.
+            logger.info(f"Resizing pool for shard {key} ({current[1]} -> {pool_size})")
+            task = asyncio.get_running_loop().create_task(current[0].dispose())
+            _RETIRED.add(task)
+            task.add_done_callback(_RETIRED.discard)
+        engine = create_async_engine(url, pool_size=pool_size, max_overflow=pool_size * 2)
+        install_vector_codec(engine)
+        _POOLS[key] = (engine, pool_size)
+    return _POOLS[key][0]
 
 async def get_tenant_session(cfg: dict):
     """
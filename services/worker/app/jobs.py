@@ -0,0 +1,247 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import text
+from app.core.settings import settings
+from app.core.tenant import get_all_tenants, get_tenant_session
+from app.core.db import get_master_session
+from app.core.notify import JOBS_CHANNEL, IngestListener
+from app.core.vector import to_vector
+from app.core.analysis_prompts import SUMMARY_PROMPTS
+from app.core.llm import generate_analysis_summary, generate_embeddings
+
+logger = logging.getLogger("analysis-job-worker")
+
+JOBS_TABLE = "analysis_jobs"
+
+
+class AnalysisJobWorker:
+    """
+    Runs /analysis/summarize requests queued with "background": true. Jobs
+    are claimed with FOR UPDATE SKIP LOCKED, so replicas need no leases; a
+    job left running longer than ANALYSIS_JOB_TIMEOUT_SECONDS (worker died)
+    is claimed again until ANALYSIS_JOB_MAX_ATTEMPTS is reached. A failed
+    attempt is queued again with an exponential backoff (not_before).
+    """
+
+    def __init__(self):
+        self.slots = asyncio.Semaphore(settings.ANALYSIS_JOB_CONCURRENCY)
+        self.listener = IngestListener((), channel=JOBS_CHANNEL) if settings.NOTIFY_ENABLED else None
+        self.backlogged = set()  # schemas with jobs left after this cycle
+
+    async def run(self):
+        logger.info("Starting analysis job worker loop...")
+        # With LISTEN/NOTIFY, full scans are only a safety net for missed notifications
+        interval = settings.FALLBACK_POLL_INTERVAL_SECONDS if self.listener else settings.POLL_INTERVAL_SECONDS
+        next_scan = 0.0
+        try:
+            while True:
+                only = None
+                if self.listener and not self.listener.missed and time.monotonic() < next_scan:
+                    only = self.listener.take()
+                else:
+                    next_scan = time.monotonic() + interval
+                    if self.listener:
+                        self.listener.missed = False
+                        self.listener.take()
+                try:
+                    await self.process_cycle(only)
+                except Exception:
+                    logger.exception("Error in analysis job loop")
+
+                if self.listener:
+                    self.listener.mark(self.backlogged)
+                    if await self.listener.wait(next_scan - time.monotonic()):
+                        await asyncio.sleep(settings.NOTIFY_DEBOUNCE_SECONDS)
+                else:
+                    await asyncio.sleep(settings.POLL_INTERVAL_SECONDS)
+        finally:
+            if self.listener:
+                await self.listener.close()
+
+    async def process_cycle(self, only: set | None = None):
+        """Claims and runs queued jobs of every tenant, or just the schemas in `only`."""
+        async for master_session in get_master_session():
+            tenants = await get_all_tenants(master_session)
+        if self.listener:
+            await self.listener.sync(tenants)
+        if only is not None:
+            tenants = [t for t in tenants if _schema(t) in only]
+        self.backlogged = set()
+
+        tenant_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_TENANTS)
+
+        async def run(t):
+            async with tenant_semaphore:
+                await self.process_tenant(t)
+
+        await asyncio.gather(*(run(t) for t in tenants))
+
+    async def process_tenant(self, t: dict):
+        schema = _schema(t)
+        limit = settings.ANALYSIS_JOB_CONCURRENCY
+        async for session in get_tenant_session(t):
+            try:
+                jobs = await self.claim(session, schema, limit)
+                await session.commit()
+            except Exception:
+                logger.exception(f"Failed claiming analysis jobs for {t['tenant_id']}")
+                await session.rollback()
+                return
+        if not jobs:
+            return
+
+        logger.info(f"Running {len(jobs)} analysis jobs for {t['tenant_id']}")
+        outcomes = await asyncio.gather(*(self.run_job(t, job) for job in jobs))
+        if len(jobs) == limit or "queued" in outcomes:
+            self.backlogged.add(schema)
+
+    async def claim(self, session, schema: str, limit: int) -> list:
+        table = f'"{schema}".{JOBS_TABLE}'
+        params = {"timeout": settings.ANALYSIS_JOB_TIMEOUT_SECONDS, "max_attempts": settings.ANALYSIS_JOB_MAX_ATTEMPTS}
+        # Jobs whose last attempt died with its worker and that have no attempts left
+        await session.execute(text(f"""
+            UPDATE {table}
+            SET status = 'failed', finished_at = now(),
+                error = coalesce(error, 'Job timed out') || ' (gave up after ' || attempts || ' attempts)'
+            WHERE status = 'running'
+              AND started_at < now() - make_interval(secs => :timeout)
+              AND attempts >= :max_attempts
+        """), params)
+        res = await session.execute(text(f"""
+            UPDATE {table} j
+            SET status = 'running', started_at = now(), attempts = j.attempts + 1
+            WHERE j.job_id IN (
+                SELECT job_id FROM {table}
+                WHERE (status = 'queued' AND not_before <= now())
+                   OR (status = 'running' AND started_at < now() - make_interval(secs => :timeout))
+                ORDER BY created_at
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING j.job_id, j.payload, j.attempts
+        """), {"timeout": params["timeout"], "limit": limit})
+        return res.fetchall()
+
+    async def run_job(self, t: dict, job) -> str:
+        """Runs one claimed job; returns its new status."""
+        started = time.perf_counter()
+        timings = {}
+        try:
+            # The budget starts at the claim, so a job waiting for a slot
+            # cannot outlive its claim and be run twice
+            async with asyncio.timeout(settings.ANALYSIS_JOB_TIMEOUT_SECONDS):
+                async with self.slots:
+                    summaries = await generate_summaries(job.payload, timings)
+
+                    # Combine Summaries
+                    current_time_str = datetime.now().isoformat()
+                    combined_text = (
+                        f"Date: {current_time_str}\n\n"
+                        f"Summary 1:\n{summaries[0]}\n\n"
+                        f"Summary 2:\n{summaries[1]}\n\n"
+                        f"Original Content Context: Summary of input."
+                    )
+                    step = time.perf_counter()
+                    embedding_vector = await generate_embeddings(combined_text)
+                    timings["embedding_ms"] = _ms(step)
+                    if not embedding_vector:
+                        raise RuntimeError("Embedding generation failed")
+        except Exception as e:
+            status = "queued" if job.attempts < settings.ANALYSIS_JOB_MAX_ATTEMPTS else "failed"
+            error = str(e) or type(e).__name__
+            retry_in = retry_delay(job.attempts) if status == "queued" else 0.0
+            logger.error(
+                f"Analysis job {job.job_id} attempt {job.attempts} failed: {error}"
+                + (f" (retrying in {retry_in:.0f}s)" if status == "queued" else "")
+            )
+            if await self.finish(t, job, status, error=error, retry_in=retry_in) and self.listener:
+                # Wake this tenant again once the backoff has passed
+                asyncio.get_running_loop().call_later(retry_in, self.listener.mark, {_schema(t)})
+            return status
+
+        post_id = str(uuid.uuid4())
+        timings["total_ms"] = _ms(started)
+        result = {"status": "ok", "post_id": post_id, "created_at": current_time_str, "timings": timings}
+        stored = await self.finish(t, job, "succeeded", result=result, post={
+            "post_id": post_id,
+            "embedding": to_vector(embedding_vector),
+            "payload": json.dumps({"combined_text": combined_text, "type": "analysis"}),
+        })
+        return "succeeded" if stored else "failed"
+
+    async def finish(self, t: dict, job, status: str, result=None, error=None, post=None, retry_in=0.0) -> bool:
+        """
+        Records the job outcome, and for a success the post_embeddings row,
+        in one transaction. Skipped if the job was reclaimed meanwhile. A
+        re-queued job is not claimed again for `retry_in` seconds.
+        """
+        schema = _schema(t)
+        async for session in get_tenant_session(t):
+            try:
+                res = await session.execute(text(f"""
+                    UPDATE "{schema}".{JOBS_TABLE}
+                    SET status = :status, result = CAST(:result AS jsonb), error = :error,
+                        finished_at = CASE WHEN :status = 'queued' THEN NULL ELSE now() END,
+                        not_before = now() + make_interval(secs => :retry_in)
+                    WHERE job_id = :job_id AND status = 'running' AND attempts = :attempts
+                """), {
+                    "status": status,
+                    "result": json.dumps(result) if result is not None else None,
+                    "error": error,
+                    "job_id": job.job_id,
+                    "attempts": job.attempts,
+                    "retry_in": retry_in,
+                })
+                if res.rowcount == 0:
+                    logger.warning(f"Analysis job {job.job_id} was reclaimed; dropping attempt {job.attempts}")
+                    await session.rollback()
+                    return False
+                if post:
+                    await session.execute(text(f"""
+                        INSERT INTO "{schema}".post_embeddings (post_id, embedding, payload, created_at)
+                        VALUES (:post_id, :embedding, CAST(:payload AS jsonb), NOW())
+                    """), post)
+                await session.commit()
+                return True
+            except Exception:
+                logger.exception(f"Failed recording analysis job {job.job_id}")
+                await session.rollback()
+                return False
+
+
+async def generate_summaries(payload_str: str, timings: dict) -> list[str]:
+    """Both summaries concurrently; if one fails the other is cancelled."""
+    async def run(index: int, instruction: str) -> str:
+        step = time.perf_counter()
+        summary = await generate_analysis_summary(payload_str, instruction)
+        timings[f"summary_{index}_ms"] = _ms(step)
+        return summary
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(run(i, p)) for i, p in enumerate(SUMMARY_PROMPTS, 1)]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        timings["summaries_ms"] = _ms(started)
+
+
+def retry_delay(attempts: int) -> float:
+    return min(
+        settings.ANALYSIS_JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        settings.ANALYSIS_JOB_RETRY_MAX_SECONDS,
+    )
+
+
+def _ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _schema(t: dict) -> str:
+    return t["tenant_id"].strip().lower()
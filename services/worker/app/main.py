@@ -1,6 +1,9 @@
 import asyncio
 import logging
 import sys
+from app.core.settings import settings
+from app.jobs import AnalysisJobWorker
+from app.summarizer import SummaryWorker
 from app.worker import SentimentWorker
 
 logging.basicConfig(
@@ -9,9 +12,16 @@ logging.basicConfig(
     stream=sys.stdout
 )
 
+async def main():
+    workers = [SentimentWorker()]
+    if settings.ANALYSIS_JOBS_ENABLED:
+        workers.append(AnalysisJobWorker())
+    if settings.SUMMARY_ENABLED:
+        workers.append(SummaryWorker())
+    await asyncio.gather(*(w.run() for w in workers))
+
 if __name__ == "__main__":
-    worker = SentimentWorker()
     try:
-        asyncio.run(worker.run())
+        asyncio.run(main())
     except KeyboardInterrupt:
         logging.info("Worker stopped by user")
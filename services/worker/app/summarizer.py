@@ -6,104 +6,234 @@ from sqlalchemy import text
 from app.core.settings import settings
 from app.core.tenant import get_all_tenants, get_tenant_session
 from app.core.db import get_master_session
-from app.core.llm import generate_table_summary, generate_embeddings
+from app.core.catalog import SchemaCatalog
+from app.core.changes import Checkpoint, extract_changes
+from app.core.leases import LeaseManager
+from app.core.notify import IngestListener
+from app.core.vector import to_vector
+from app.core.llm import (
+    chunk_text, estimate_tokens, generate_collated_summary, generate_embeddings, generate_table_summary
+)
 
 logger = logging.getLogger("summary-worker")
 
+EXCLUDED_TABLES = ('post_embeddings', 'summary_checkpoint', 'summary_table_checkpoints', 'analysis_jobs', 'raw_events')
+TS_CANDIDATES = ['last_updated', 'processed_at', 'fetched_at', 'ingested_at', 'snapshot_time', 'created_at']
+
 class SummaryWorker:
     def __init__(self):
-        pass
+        # Bounds summary LLM calls (map and collate) across all tenants being processed
+        self.table_semaphore = asyncio.Semaphore(settings.SUMMARY_MAX_CONCURRENT_TABLES)
+        self.catalog = SchemaCatalog(settings.SCHEMA_CATALOG_TTL_SECONDS, TS_CANDIDATES, EXCLUDED_TABLES)
+        # Bootstrap and dbt runs NOTIFY schema_changed; drop the cached catalog then
+        self.listener = (
+            IngestListener((), on_schema_change=self.catalog.invalidate) if settings.NOTIFY_ENABLED else None
+        )
+        # Every replica runs a SummaryWorker; each tenant is summarized by the
+        # one holding its "summary" lease
+        self.leases = LeaseManager("summary") if settings.LEASES_ENABLED else None
+        self.heartbeat = None
+
+    async def start(self):
+        if self.leases:
+            await self.leases.setup()
+            self.heartbeat = asyncio.create_task(self.leases.heartbeat_loop())
+
+    async def run(self):
+        logger.info("Starting summary worker loop...")
+        await self.start()
+        try:
+            while True:
+                try:
+                    await self.process_cycle()
+                except Exception:
+                    logger.exception("Error in summary worker loop")
+                logger.info(f"Next summary cycle in {settings.SUMMARY_INTERVAL_SECONDS}s")
+                await asyncio.sleep(settings.SUMMARY_INTERVAL_SECONDS)
+        finally:
+            await self.close()
+
+    async def run_once(self):
+        """One cycle, then closes the LISTEN connections and leases (scripts, cron)."""
+        await self.start()
+        try:
+            await self.process_cycle()
+        finally:
+            await self.close()
+
+    async def close(self):
+        if self.listener:
+            await self.listener.close()
+        if self.heartbeat:
+            self.heartbeat.cancel()
+            self.heartbeat = None
+            await self.leases.release()
 
     async def process_cycle(self):
         async for master_session in get_master_session():
             tenants = await get_all_tenants(master_session)
+            if self.leases:
+                owned = await self.leases.acquire(master_session, [t["tenant_id"] for t in tenants])
+                tenants = [t for t in tenants if t["tenant_id"] in owned]
         
-        logger.info(f"Found {len(tenants)} active tenants for summarization")
+        logger.info(f"Found {len(tenants)} {'leased' if self.leases else 'active'} tenants for summarization")
+
+        if self.listener:
+            await self.listener.sync(tenants)
+        await self.load_catalogs(tenants)
+
+        tenant_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_TENANTS)
+
+        async def run(t):
+            async with tenant_semaphore:
+                try:
+                    await self.process_tenant(t)
+                except Exception:
+                    # One tenant (or its shard) failing must not abort the others
+                    logger.exception(f"Failed summary for {t['tenant_id']}")
+
+        await asyncio.gather(*(run(t) for t in tenants))
 
+    async def load_catalogs(self, tenants: list[dict]):
+        """Loads uncached schemas with one catalog query per shard."""
+        by_shard = {}
         for t in tenants:
-            await self.process_tenant(t)
+            key = t.get("shard_id") or f"{t['host']}:{t['port']}:{t['db_name']}"
+            by_shard.setdefault(key, []).append(t)
+
+        for shard_tenants in by_shard.values():
+            schemas = [t["tenant_id"].strip().lower() for t in shard_tenants]
+            try:
+                async for session in get_tenant_session(shard_tenants[0]):
+                    await self.catalog.load(session, schemas)
+            except Exception:
+                # Unreachable shard or failed query: process_tenant retries per schema
+                logger.exception(f"Failed loading catalog for {len(schemas)} schemas")
+
+    async def summarize_table(self, table: str, raw_table_data: str) -> list[str]:
+        """
+        Map step: one summary per SUMMARY_CHUNK_TOKENS chunk of a table's
+        changes, in parallel. Raises if any chunk could not be summarized.
+        """
+        chunks = chunk_text(raw_table_data, settings.SUMMARY_CHUNK_TOKENS)
+
+        async def summarize(i, chunk):
+            label = table if len(chunks) == 1 else f"{table} (part {i + 1}/{len(chunks)})"
+            async with self.table_semaphore:
+                partial = await generate_table_summary(label, chunk)
+            if partial is None:
+                raise RuntimeError(f"Table summary failed for {label}")
+            return f"### Table: {label}\n{partial}"
+
+        return list(await asyncio.gather(*(summarize(i, c) for i, c in enumerate(chunks))))
+
+    async def collate(self, parts: list[str]) -> str:
+        """
+        Reduce step: merges summaries in groups of at most
+        SUMMARY_REDUCE_MAX_TOKENS (two or more per group) with COLLATE_PROMPT,
+        level by level, until one remains. A failed collation keeps its
+        group concatenated.
+        """
+        while len(parts) > 1:
+            groups, current, tokens = [], [], 0
+            for part in parts:
+                cost = estimate_tokens(part)
+                if len(current) >= 2 and tokens + cost > settings.SUMMARY_REDUCE_MAX_TOKENS:
+                    groups.append(current)
+                    current, tokens = [], 0
+                current.append(part)
+                tokens += cost
+            if len(current) == 1 and groups:
+                groups[-1].append(current[0])
+            elif current:
+                groups.append(current)
+
+            async def reduce(group):
+                async with self.table_semaphore:
+                    collated = await generate_collated_summary(group)
+                return collated or "\n\n".join(group)
+
+            parts = list(await asyncio.gather(*(reduce(g) for g in groups)))
+        return parts[0]
 
     async def process_tenant(self, t: dict):
         tenant_id = t["tenant_id"]
         schema = tenant_id.strip().lower() # Use tenant_id directly as schema name
-        
-        async for session in get_tenant_session(t):
-            try:
-                # 1. Get last checkpoint
+
+        # Read phase: checkpoints, catalog and aggregated changes. The session
+        # is released before any LLM call.
+        changes = {}
+        try:
+            async for session in get_tenant_session(t):
+                # 1. Get per-table checkpoints. Tables without one start from
+                # the last global summary (tenants summarized before per-table
+                # checkpoints existed), or from the beginning.
+                res = await session.execute(text(
+                    f'SELECT table_name, last_ts, last_pk FROM "{schema}".summary_table_checkpoints'
+                ))
+                checkpoints = {r.table_name: Checkpoint(r.last_ts, r.last_pk) for r in res.fetchall()}
                 checkpoint_query = text(f'SELECT last_summarized_at FROM "{schema}".summary_checkpoint ORDER BY last_summarized_at DESC LIMIT 1')
                 res = await session.execute(checkpoint_query)
                 row = res.fetchone()
-                last_ts = row[0] if row else datetime(2000, 1, 1)
+                default_cp = Checkpoint(str(row[0])) if row else Checkpoint()
 
-                logger.info(f"Last summary for {tenant_id} at {last_ts}")
+                logger.info(f"{len(checkpoints)} table checkpoints for {tenant_id}")
 
-                # 2. Discover Tables
-                discover_query = text("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = :schema 
-                    AND table_name NOT IN ('post_embeddings', 'summary_checkpoint', 'raw_events')
-                """)
-                res = await session.execute(discover_query, {"schema": schema})
-                tables = [r[0] for r in res.fetchall()]
-                
-                partial_summaries = []
-                all_raw_changes = []
-                
-                # 3. Summarize each table individually
-                for table in tables:
-                    columns_query = text("""
-                        SELECT column_name 
-                        FROM information_schema.columns 
-                        WHERE table_schema = :schema AND table_name = :table
-                    """)
-                    res = await session.execute(columns_query, {"schema": schema, "table": table})
-                    cols = [r[0] for r in res.fetchall()]
-                    
-                    ts_col = None
-                    for candidate in ['last_updated', 'processed_at', 'fetched_at', 'ingested_at', 'snapshot_time', 'created_at']:
-                        if candidate in cols:
-                            ts_col = candidate
-                            break
-                    
-                    if not ts_col:
+                # 2. Tables and their timestamp columns (cached catalog)
+                await self.catalog.load(session, [schema])
+                for table, info in sorted(self.catalog.tables(schema).items()):
+                    if not info.ts_col:
                         continue
 
-                    # Fetch changed rows
-                    change_query = text(f'SELECT * FROM "{schema}"."{table}" WHERE {ts_col} > :ts LIMIT 50')
-                    res = await session.execute(change_query, {"ts": last_ts})
-                    rows = res.fetchall()
-                    
-                    if rows:
-                        logger.info(f"Found {len(rows)} changes in {table}, summarizing...")
-                        table_changes = []
-                        for r in rows:
-                            row_data = ", ".join([f"{cols[i]}={r[i]}" for i in range(len(cols)) if i < len(r)])
-                            table_changes.append(row_data)
-                        
-                        raw_table_data = "\n".join(table_changes)
-                        all_raw_changes.append(f"--- Table: {table} ---\n{raw_table_data}")
-                        
-                        # Partial summary for this table
-                        partial = await generate_table_summary(table, raw_table_data)
-                        partial_summaries.append(f"### Table: {table}\n{partial}")
-
-                if not partial_summaries:
-                    logger.info(f"No new changes for {tenant_id}")
-                    return
-
-                # 4. Concatenate all partial summaries
-                logger.info(f"Concatenating {len(partial_summaries)} table summaries for {tenant_id}")
-                final_summary = "\n\n".join(partial_summaries)
-                
-                # 5. Generate Embeddings for the concatenated string
-                logger.info(f"Generating embeddings for final summary...")
-                embedding_vector = await generate_embeddings(final_summary)
-                
-                # Log raw changes for audit
-                with open("llm_summary_input.log", "w") as f:
-                    f.write("\n\n".join(all_raw_changes))
-                
+                    # Aggregate the next window of changes (keyset on (ts_col, pk))
+                    table_changes = await extract_changes(
+                        session, schema, table, info, checkpoints.get(table, default_cp),
+                        cap=settings.SUMMARY_MAX_ROWS_PER_TABLE,
+                        top_n=settings.SUMMARY_TOP_N,
+                        max_distinct=settings.SUMMARY_TOP_N_MAX_DISTINCT,
+                    )
+                    if table_changes:
+                        logger.info(f"Found {table_changes.rows} changes in {table}, summarizing...")
+                        changes[table] = (table_changes, table_changes.to_text(info.ts_col))
+        except Exception:
+            logger.exception(f"Failed reading changes for {tenant_id}")
+            return
+
+        if not changes:
+            logger.info(f"No new changes for {tenant_id}")
+            return
+
+        try:
+            # 3. Summarize every changed table concurrently
+            per_table = await asyncio.gather(*(
+                self.summarize_table(table, data) for table, (_, data) in changes.items()
+            ))
+            partial_summaries = [p for parts in per_table for p in parts]
+            all_raw_changes = [f"--- Table: {table} ---\n{data}" for table, (_, data) in changes.items()]
+
+            # 4. Collate the partial summaries into one
+            logger.info(f"Collating {len(partial_summaries)} partial summaries for {tenant_id}")
+            final_summary = await self.collate(partial_summaries)
+
+            # 5. Generate Embeddings for the final summary (chunked, so length is not capped)
+            logger.info(f"Generating embeddings for final summary...")
+            embedding_vector = await generate_embeddings(final_summary)
+            if not embedding_vector:
+                raise RuntimeError("Embedding generation failed")
+        except Exception:
+            # Nothing is stored and no checkpoint moves, so the same windows
+            # are summarized again next cycle
+            logger.exception(f"Failed summary for {tenant_id}")
+            return
+
+        # Log raw changes for audit, one file per tenant, off the event loop
+        try:
+            await asyncio.to_thread(_write_audit_log, schema, "\n\n".join(all_raw_changes))
+        except OSError:
+            logger.exception(f"Failed writing the summary input log for {tenant_id}")
+
+        try:
+            async for session in get_tenant_session(t):
                 # 6. Store result
                 summary_id = f"summary_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
                 insert_sql = text(f"""
@@ -116,18 +246,33 @@ class SummaryWorker:
                         "summary": final_summary, 
                         "partial_summaries": partial_summaries,
                         "type": "global_daily", 
-                        "source_tables_count": len(partial_summaries)
+                        "source_tables_count": len(changes)
                     }),
-                    "embedding": str(embedding_vector) if embedding_vector else None
+                    "embedding": to_vector(embedding_vector)
                 })
                 
-                # 7. Update checkpoint
-                checkpoint_sql = text(f'INSERT INTO "{schema}".summary_checkpoint (last_summarized_at, summary_type) VALUES (now(), :type)')
-                await session.execute(checkpoint_sql, {"type": "global_daily"})
+                # 7. Advance each summarized table's checkpoint to the end of its window
+                await session.execute(text(f"""
+                    INSERT INTO "{schema}".summary_table_checkpoints (table_name, last_ts, last_pk, updated_at)
+                    VALUES (:table, :ts, :pk, now())
+                    ON CONFLICT (table_name) DO UPDATE
+                    SET last_ts = EXCLUDED.last_ts, last_pk = EXCLUDED.last_pk, updated_at = now()
+                """), [
+                    {"table": table, "ts": c.end.ts, "pk": c.end.pk}
+                    for table, (c, _) in changes.items()
+                ])
+                checkpoint_sql = text(f'INSERT INTO "{schema}".summary_checkpoint (last_summarized_at, summary_type, metadata) VALUES (now(), :type, :metadata)')
+                await session.execute(checkpoint_sql, {
+                    "type": "global_daily",
+                    "metadata": json.dumps({table: c.rows for table, (c, _) in changes.items()}),
+                })
                 
                 await session.commit()
                 logger.info(f"Generated and saved final concatenated summary and embeddings for {tenant_id}")
+        except Exception:
+            logger.exception(f"Failed summary for {tenant_id}")
 
-            except Exception:
-                logger.exception(f"Failed summary for {tenant_id}")
-                await session.rollback()
+
+def _write_audit_log(schema: str, content: str):
+    with open(f"llm_summary_input_{schema}.log", "w") as f:
+        f.write(content)
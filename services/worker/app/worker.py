@@ -1,110 +1,625 @@
 import asyncio
 import logging
+import math
+import time
+from dataclasses import dataclass, field
 from sqlalchemy import text
 from app.core.settings import settings
-from app.core.tenant import get_all_tenants, get_tenant_session
+from app.core.tenant import get_all_tenants, get_tenant_session, invalidate_tenants
 from app.core.db import get_master_session
-from app.core.llm import analyze_sentiment
+from app.core.leases import LeaseManager
+from app.core.notify import IngestListener
+from app.core.sentiment_cache import SentimentCache
+from app.core.llm import analyze_sentiment_batch, chat_limiter, new_usage, pack_batches
+from app.core.scheduler import FairScheduler
 
 logger = logging.getLogger("sentiment-worker")
 
+CURSOR_NAME = "sentiment"
+
+# The worker's own tables, as in services/api/sql/bootstrap.sql. Created on
+# first use so tenants bootstrapped before they existed keep being processed.
+TENANT_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS "{schema}".worker_cursors (
+        cursor_name TEXT PRIMARY KEY,
+        last_id BIGINT NOT NULL DEFAULT 0,
+        safe_id BIGINT NOT NULL DEFAULT 0,
+        horizon_id BIGINT,
+        horizon_xmax BIGINT,
+        updated_at TIMESTAMP DEFAULT now()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS "{schema}".sentiment_failures (
+        interaction_id TEXT PRIMARY KEY,
+        row_id BIGINT NOT NULL,
+        attempts INT NOT NULL DEFAULT 1,
+        last_error TEXT,
+        retry_at TIMESTAMP NOT NULL DEFAULT now(),
+        updated_at TIMESTAMP DEFAULT now()
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_sentiment_failures_retry_at
+        ON "{schema}".sentiment_failures(retry_at)
+    """,
+)
+
+# Text of an interaction, whichever field the platform put it in
+_TEXT_SQL = """COALESCE(
+    i.raw_json->>'text', i.raw_json->>'message', i.raw_json->>'caption', i.raw_json->>'comment'
+)"""
+
+
+@dataclass
+class WorkItem:
+    """One page of a tenant's interactions moving through the pipeline."""
+    tenant: dict
+    schema: str
+    last_id: int
+    items: list
+    more: bool = False  # the page was full, so the tenant has more backlog
+    backlog: int = 0  # estimated rows past the cursor when the page was fetched
+    row_ids: dict = field(default_factory=dict)  # interaction_id -> raw_social_interactions.id
+    results: dict = field(default_factory=dict)
+    unavailable: set = field(default_factory=set)  # interaction ids that failed on an exhausted rate limit
+    retried: set = field(default_factory=set)  # interaction ids re-read from sentiment_failures
+    failed: dict = field(default_factory=dict)  # interaction_id -> error, for sentiment_failures
+
+    def requeue_failed(self) -> int:
+        """
+        Moves every interaction left without a result into `failed`, so
+        write_items records it in sentiment_failures (to be retried with a
+        backoff) in the same transaction that moves the cursor past it.
+        Nothing is written to sentiment_results for them. Returns the count.
+        """
+        for interaction_id, _ in self.items:
+            if interaction_id not in self.results:
+                self.failed[interaction_id] = (
+                    "rate limited" if interaction_id in self.unavailable else "no valid result"
+                )
+        return len(self.failed)
+
+
 class SentimentWorker:
     def __init__(self):
-        self.semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+        self.leases = LeaseManager("sentiment") if settings.LEASES_ENABLED else None
+        self.cache = SentimentCache()
+        self.listener = IngestListener(("raw_social_interactions",)) if settings.NOTIFY_ENABLED else None
+        self.backlogged = set()  # schemas whose last page was full
+        self.ready = set()  # schemas whose worker tables are known to exist
+        # LLM batches from all tenants share the adaptive concurrency limit fairly
+        self.scheduler = FairScheduler(
+            slots=lambda: chat_limiter.concurrency.limit,
+            per_tenant_cap=settings.TENANT_MAX_CONCURRENT_BATCHES,
+        )
 
     async def run(self):
         logger.info("Starting sentiment worker loop...")
-        while True:
-            try:
-                await self.process_cycle()
-            except Exception:
-                logger.exception("Error in worker loop")
-            
-            logger.info(f"Sleeping for {settings.POLL_INTERVAL_SECONDS}s")
-            await asyncio.sleep(settings.POLL_INTERVAL_SECONDS)
+        heartbeat = None
+        await self.cache.setup()
+        if self.leases:
+            await self.leases.setup()
+            heartbeat = asyncio.create_task(self.leases.heartbeat_loop())
+        # With LISTEN/NOTIFY, full scans are only a safety net for missed notifications
+        interval = settings.FALLBACK_POLL_INTERVAL_SECONDS if self.listener else settings.POLL_INTERVAL_SECONDS
+        next_scan = 0.0
+        try:
+            while True:
+                only = None
+                if self.listener and not self.listener.missed and time.monotonic() < next_scan:
+                    only = self.listener.take()
+                else:
+                    next_scan = time.monotonic() + interval
+                    if self.listener:
+                        self.listener.missed = False
+                        self.listener.take()
+                try:
+                    await self.process_cycle(only)
+                except Exception:
+                    logger.exception("Error in worker loop")
+
+                if self.listener:
+                    self.listener.mark(self.backlogged)
+                    # Wake for lease rebalances too, so tenants of a dead
+                    # replica are taken over within LEASE_TTL_SECONDS
+                    wake_at = min(next_scan, self.leases.next_rebalance()) if self.leases else next_scan
+                    if await self.listener.wait(wake_at - time.monotonic()):
+                        # Coalesce bursts of notifications into one cycle
+                        await asyncio.sleep(settings.NOTIFY_DEBOUNCE_SECONDS)
+                else:
+                    logger.info(f"Sleeping for {settings.POLL_INTERVAL_SECONDS}s")
+                    await asyncio.sleep(settings.POLL_INTERVAL_SECONDS)
+        finally:
+            if self.listener:
+                await self.listener.close()
+            if heartbeat:
+                heartbeat.cancel()
+                await self.leases.release()
 
-    async def process_cycle(self):
-        # 1. Fetch all active tenants
+    async def process_cycle(self, only: set | None = None):
+        """Processes every leased tenant, or just the schemas in `only` (woken by NOTIFY)."""
+        # 1. Fetch all active tenants, keeping only those leased to this replica
         async for master_session in get_master_session():
             tenants = await get_all_tenants(master_session)
-        
-        logger.info(f"Found {len(tenants)} active tenants")
+            if only is not None and not only <= {_schema(t) for t in tenants}:
+                # A tenant we have not seen yet (e.g. just bootstrapped)
+                invalidate_tenants()
+                tenants = await get_all_tenants(master_session)
+            if self.leases and (only is None or self.leases.rebalance_due()):
+                previous = self.leases.owned
+                owned = await self.leases.acquire(master_session, [t["tenant_id"] for t in tenants])
+                if only is not None:
+                    # Tenants taken over since the last rebalance get a full pass
+                    only = only | {_schema(t) for t in tenants if t["tenant_id"] in owned - previous}
+            elif self.leases:
+                owned = self.leases.owned
+            if self.leases:
+                tenants = [t for t in tenants if t["tenant_id"] in owned]
+        if self.listener:
+            await self.listener.sync(tenants)
+        if only is not None:
+            tenants = [t for t in tenants if _schema(t) in only]
+            if not tenants:
+                return
+
+        logger.info(f"Processing {len(tenants)} {'notified' if only is not None else 'active'} tenants")
+        self.backlogged = set()
+
+        # 2. Run the fetch -> inference -> write pipeline. Bounded queues give
+        # backpressure; DB sessions are only held inside fetch_work/write_items.
+        infer_q = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+        write_q = asyncio.Queue(maxsize=settings.PIPELINE_QUEUE_SIZE)
+        inferers = [
+            asyncio.create_task(self.inference_stage(infer_q, write_q))
+            for _ in range(settings.MAX_CONCURRENT_TENANTS)
+        ]
+        writer = asyncio.create_task(self.write_stage(write_q))
+
+        async def feed():
+            await self.fetch_stage(tenants, infer_q, write_q)
+            for _ in inferers:
+                await infer_q.put(None)
+            await asyncio.gather(*inferers)
+            await write_q.put(None)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            # If the writer dies nothing drains write_q and the feeder would
+            # block on put() for ever, so stop as soon as either one fails
+            done, _ = await asyncio.wait((feeder, writer), return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in (feeder, *inferers, writer):
+                task.cancel()
+
+    async def fetch_stage(self, tenants, infer_q, write_q):
+        fetch_sem = asyncio.Semaphore(settings.MAX_CONCURRENT_TENANTS)
+
+        async def estimate(t):
+            async with fetch_sem:
+                return await self.estimate_backlog(t)
+
+        # Idle tenants stop after the high-water-mark probe. The rest are
+        # fetched smallest backlog first so a few new rows are not queued
+        # behind a tenant that is catching up on a large one.
+        estimates = await asyncio.gather(*(estimate(t) for t in tenants))
+        pending = sorted(
+            ((t, start_id, safe_id, backlog) for t, (start_id, safe_id, backlog) in zip(tenants, estimates) if backlog > 0),
+            key=lambda e: e[3],
+        )
+        if pending:
+            logger.info(f"{len(pending)}/{len(tenants)} tenants have backlog (largest ~{pending[-1][3]} rows)")
+
+        async def produce(t, start_id, safe_id, backlog):
+            async with fetch_sem:
+                item = await self.fetch_work(t, start_id, safe_id, page_size_for(backlog))
+            if item is None:
+                return
+            item.backlog = backlog
+            if item.more:
+                self.backlogged.add(item.schema)
+            # Pages with nothing to classify only need their cursor advanced
+            await (infer_q if item.items else write_q).put(item)
+
+        await asyncio.gather(*(produce(*e) for e in pending))
+
+    async def inference_stage(self, infer_q, write_q):
+        while (item := await infer_q.get()) is not None:
+            try:
+                # 4. Analyze (cache first, then packed LLM batches)
+                item.results = await self.classify(
+                    item.tenant["tenant_id"], item.items, tenant_weight(item.backlog), item.unavailable
+                )
+            except Exception:
+                # Cursor is not advanced, so the page is fetched again next cycle
+                logger.exception(f"Inference failed for {item.tenant['tenant_id']}")
+                continue
+            # Results for the rest are kept; failed rows are retried from
+            # sentiment_failures once their backoff has passed
+            failed = item.requeue_failed()
+            if failed:
+                # Leave throttled tenants to the next scan instead of spinning
+                self.backlogged.discard(item.schema)
+                logger.warning(f"{failed} interactions for {item.tenant['tenant_id']} not classified, queued for retry")
+            await write_q.put(item)
+
+    async def write_stage(self, write_q):
+        """
+        Buffers finished pages and writes them every SENTIMENT_FLUSH_SIZE rows
+        or SENTIMENT_FLUSH_INTERVAL_SECONDS. write_items handles its own
+        errors, so a failed flush only leaves those cursors where they were.
+        """
+        buffer, rows = [], 0
+        deadline = 0.0
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if buffer else None
+            try:
+                item = await asyncio.wait_for(write_q.get(), timeout)
+            except asyncio.TimeoutError:
+                await self.write_items(buffer)
+                buffer, rows = [], 0
+                continue
+
+            if item is None:
+                if buffer:
+                    await self.write_items(buffer)
+                return
 
-        # 2. Process tenants in parallel chunks
-        chunk_size = settings.MAX_CONCURRENT_TENANTS
-        for i in range(0, len(tenants), chunk_size):
-            batch = tenants[i:i + chunk_size]
-            await asyncio.gather(*(self.process_tenant(t) for t in batch))
+            if not buffer:
+                deadline = time.monotonic() + settings.SENTIMENT_FLUSH_INTERVAL_SECONDS
+            buffer.append(item)
+            rows += len(item.results)
+            if rows >= settings.SENTIMENT_FLUSH_SIZE:
+                await self.write_items(buffer)
+                buffer, rows = [], 0
 
-    async def process_tenant(self, t: dict):
+    async def estimate_backlog(self, t: dict) -> tuple[int, int, int]:
+        """
+        Returns (cursor, safe id, rows past the cursor plus failures due for
+        a retry). max(id) is a single index probe; the gap over-counts rows
+        that were already analyzed, which only matters for ordering.
+
+        Ids are assigned at insert, not at commit, so a transaction still in
+        progress may hold ids below rows that are already visible. The
+        cursor must not pass those, so it is capped at the safe id: every
+        id up to it is committed or rolled back. The max(id) seen here
+        becomes safe once every transaction in progress right after reading
+        it has ended, which a later call checks against the snapshot xmin.
+        """
+        schema = _schema(t)
+        # Connect errors included: one unreachable shard must not fail the
+        # whole fetch stage, only leave its tenants for the next cycle
+        try:
+            async for session in get_tenant_session(t):
+                if schema not in self.ready:
+                    for ddl in TENANT_DDL:
+                        await session.execute(text(ddl.format(schema=schema)))
+                    await session.commit()
+                    self.ready.add(schema)
+                res = await session.execute(text(f"""
+                    SELECT
+                        COALESCE(c.last_id, 0) AS last_id,
+                        COALESCE(c.safe_id, 0) AS safe_id,
+                        c.horizon_id,
+                        c.horizon_xmax,
+                        COALESCE((SELECT max(id) FROM "{schema}".raw_social_interactions), 0) AS high_water,
+                        (
+                            SELECT count(*) FROM "{schema}".sentiment_failures
+                            WHERE attempts < :max_attempts AND retry_at <= now()
+                        ) AS retries
+                    FROM (SELECT 1) AS one
+                    LEFT JOIN "{schema}".worker_cursors c ON c.cursor_name = :name
+                """), {"name": CURSOR_NAME, "max_attempts": settings.SENTIMENT_MAX_ATTEMPTS})
+                row = res.fetchone()
+                # A separate statement, so its snapshot is taken after max(id) was read
+                res = await session.execute(text("""
+                    SELECT
+                        pg_snapshot_xmin(s)::text::bigint AS xmin,
+                        pg_snapshot_xmax(s)::text::bigint AS xmax
+                    FROM pg_current_snapshot() AS s
+                """))
+                snapshot = res.fetchone()
+                horizon = settle_horizon(
+                    row.safe_id, row.horizon_id, row.horizon_xmax, row.high_water, snapshot.xmin, snapshot.xmax
+                )
+                if horizon != (row.safe_id, row.horizon_id, row.horizon_xmax):
+                    await session.execute(text(f"""
+                        INSERT INTO "{schema}".worker_cursors
+                            (cursor_name, last_id, safe_id, horizon_id, horizon_xmax, updated_at)
+                        VALUES (:name, 0, :safe_id, :horizon_id, :horizon_xmax, now())
+                        ON CONFLICT (cursor_name) DO UPDATE
+                        SET safe_id = GREATEST(worker_cursors.safe_id, EXCLUDED.safe_id),
+                            horizon_id = EXCLUDED.horizon_id,
+                            horizon_xmax = EXCLUDED.horizon_xmax,
+                            updated_at = now()
+                    """), {
+                        "name": CURSOR_NAME, "safe_id": horizon[0],
+                        "horizon_id": horizon[1], "horizon_xmax": horizon[2],
+                    })
+                    await session.commit()
+        except Exception:
+            logger.exception(f"Failed estimating backlog for tenant {t['tenant_id']}")
+            return 0, 0, 0
+        return row.last_id, horizon[0], max(row.high_water - row.last_id, 0) + row.retries
+
+    async def fetch_work(self, t: dict, start_id: int, safe_id: int, limit: int):
+        """
+        Reads up to `limit` unprocessed interactions past `start_id` in a
+        short-lived session. The page's cursor advance stops at `safe_id`;
+        rows read past it are skipped as analyzed when they are read again.
+        """
         tenant_id = t["tenant_id"]
-        logger.info(f"Processing tenant: {tenant_id}")
         # Compute schema name for qualifying tables
         schema = tenant_id.strip().lower() # Use tenant_id directly as schema name
-        
-        async for session in get_tenant_session(t):
-            # 3. Fetch unprocessed interactions
-            try:
+        last_id = start_id
+
+        try:
+            async for session in get_tenant_session(t):
+                # 3. Fetch unprocessed interactions past the tenant's high-water mark
+                # Range scan on the primary key. The EXISTS probes are one
+                # index lookup per row and skip interactions analyzed before
+                # the cursor existed (or ingested twice), or waiting for a
+                # retry. Rows stored as "unclassified" by older workers are
+                # analyzed again and overwritten.
                 query = text(f"""
-                    SELECT 
-                        raw_json->>'interaction_id' as id,
-                        COALESCE(
-                            raw_json->>'text', 
-                            raw_json->>'message', 
-                            raw_json->>'caption', 
-                            raw_json->>'comment'
-                        ) as text
-                    FROM "{schema}".raw_social_interactions
-                    WHERE (raw_json->>'interaction_id') NOT IN (
-                        SELECT interaction_id FROM "{schema}".sentiment_results
-                    )
-                    AND COALESCE(
-                        raw_json->>'text', 
-                        raw_json->>'message', 
-                        raw_json->>'caption', 
-                        raw_json->>'comment'
-                    ) IS NOT NULL
+                    SELECT
+                        i.id AS row_id,
+                        i.raw_json->>'interaction_id' as id,
+                        {_TEXT_SQL} as text,
+                        EXISTS (
+                            SELECT 1 FROM "{schema}".sentiment_results s
+                            WHERE s.interaction_id = i.raw_json->>'interaction_id'
+                              AND s.model_version IS DISTINCT FROM 'unclassified'
+                        ) OR EXISTS (
+                            SELECT 1 FROM "{schema}".sentiment_failures f
+                            WHERE f.interaction_id = i.raw_json->>'interaction_id'
+                        ) AS done
+                    FROM "{schema}".raw_social_interactions i
+                    WHERE i.id > :last_id
+                    ORDER BY i.id
                     LIMIT :limit
                 """)
-                
-                result = await session.execute(query, {"limit": settings.BATCH_SIZE})
-                rows = result.fetchall()
-                
-                if not rows:
-                    logger.info(f"No new interactions for tenant {tenant_id}")
-                    return
-
-                logger.info(f"Found {len(rows)} interactions to analyze for {tenant_id}")
-                
-                # 4. Analyze in parallel (limited by semaphore)
-                tasks = [self.analyze_and_save(session, schema, row.id, row.text) for row in rows]
-                await asyncio.gather(*tasks)
-                
-                await session.commit()
-                logger.info(f"Committed batch for {tenant_id}")
 
+                # Skip over pages with nothing to analyze so the cursor catches up
+                rows, more = [], False
+                while True:
+                    result = await session.execute(query, {"last_id": last_id, "limit": limit})
+                    page = result.fetchall()
+                    if not page:
+                        break
+                    last_id = page[-1].row_id
+                    # Interactions ingested more than once are analyzed once
+                    rows = list({r.id: r for r in page if r.id and r.text and not r.done}.values())
+                    more = len(page) == limit
+                    if rows or not more:
+                        break
+
+                # Failures whose backoff has passed ride along with the page
+                result = await session.execute(text(f"""
+                    SELECT f.row_id, f.interaction_id AS id, {_TEXT_SQL} AS text
+                    FROM "{schema}".sentiment_failures f
+                    JOIN "{schema}".raw_social_interactions i ON i.id = f.row_id
+                    WHERE f.attempts < :max_attempts AND f.retry_at <= now()
+                    ORDER BY f.retry_at
+                    LIMIT :limit
+                """), {"max_attempts": settings.SENTIMENT_MAX_ATTEMPTS, "limit": limit})
+                retries = [r for r in result.fetchall() if r.text]
+        except Exception:
+            logger.exception(f"Failed fetching work for tenant {tenant_id}")
+            return None
+
+        if not rows and not retries and min(last_id, safe_id) <= start_id:
+            logger.info(f"No new interactions for tenant {tenant_id}")
+            return None
+
+        retried = {r.id for r in retries} - {r.id for r in rows}
+        rows += [r for r in retries if r.id in retried]
+        if rows:
+            logger.info(f"Found {len(rows)} interactions to analyze for {tenant_id} ({len(retried)} retries)")
+        return WorkItem(
+            tenant=t, schema=schema, last_id=max(min(last_id, safe_id), start_id), more=more,
+            items=[(row.id, row.text) for row in rows],
+            row_ids={row.id: row.row_id for row in rows},
+            retried=retried,
+        )
+
+    async def write_items(self, items):
+        """
+        Writes results and cursor advances, one transaction per shard with a
+        savepoint per page, so one tenant's failed write does not roll back
+        the others. Never raises: pages that were not written keep their old
+        cursor and are fetched again.
+        """
+        by_shard = {}
+        for item in items:
+            t = item.tenant
+            key = t.get("shard_id") or f"{t['host']}:{t['port']}:{t['db_name']}"
+            by_shard.setdefault(key, []).append(item)
+
+        for shard_items in by_shard.values():
+            written = []
+            try:
+                async for session in get_tenant_session(shard_items[0].tenant):
+                    for item in shard_items:
+                        try:
+                            # Results, failures and the cursor advance commit together
+                            async with session.begin_nested():
+                                await self.save_results(session, item.schema, item.results)
+                                await self.save_failures(session, item)
+                                await session.execute(text(f"""
+                                    INSERT INTO "{item.schema}".worker_cursors (cursor_name, last_id, updated_at)
+                                    VALUES (:name, :last_id, now())
+                                    ON CONFLICT (cursor_name) DO UPDATE
+                                    SET last_id = GREATEST(worker_cursors.last_id, EXCLUDED.last_id),
+                                        updated_at = now()
+                                """), {"name": CURSOR_NAME, "last_id": item.last_id})
+                            written.append(item)
+                        except Exception:
+                            logger.exception(f"Failed writing results for {item.tenant['tenant_id']}")
+                    await session.commit()
             except Exception:
-                logger.exception(f"Failed processing tenant {tenant_id}")
-                await session.rollback()
+                # Connect / search_path / commit failures on this shard
+                logger.exception(f"Failed writing results for {len(shard_items)} tenants")
+                continue
+            for item in written:
+                logger.info(f"Committed batch for {item.tenant['tenant_id']} (cursor at {item.last_id})")
+
+    async def classify(self, tenant_id, items, weight=1.0, unavailable=None):
+        """
+        Returns {interaction_id: result}, calling the LLM only for texts not
+        already cached. Ids left out because the LLM was unavailable are
+        added to `unavailable`.
+        """
+        results, pending = await self.cache.lookup(items)
+        if not pending:
+            logger.info(f"All {len(items)} interactions for {tenant_id} served from cache")
+            return results
+
+        # One representative per distinct text; batches are queued fairly
+        # against other tenants' and paced by chat_limiter
+        stats = new_usage()
+        started = time.perf_counter()
+        batches = pack_batches([group[0] for group in pending.values()])
+        classified, throttled = {}, set()
+        for batch_results in await asyncio.gather(*(
+            self.scheduler.run(tenant_id, len(b), weight, lambda b=b: analyze_sentiment_batch(b, stats, throttled))
+            for b in batches
+        )):
+            classified.update(batch_results)
+
+        fresh = {}
+        for key, group in pending.items():
+            result = classified.get(group[0][0])
+            if result is None:
+                if unavailable is not None and group[0][0] in throttled:
+                    unavailable.update(interaction_id for interaction_id, _ in group)
+                continue
+            fresh[key] = result
+            for interaction_id, _ in group:
+                results[interaction_id] = result
+        await self.cache.store(fresh)
 
-    async def analyze_and_save(self, session, schema, interaction_id, text_content):
-        if not text_content:
-            return
+        self.log_usage(tenant_id, len(classified), stats, time.perf_counter() - started)
+        logger.info(f"Sentiment cache: {self.cache.stats()}, LLM limiter: {chat_limiter.stats()}")
+        return results
 
-        async with self.semaphore:
-            result = await analyze_sentiment(text_content)
-        
-        # 5. Save result
+    def log_usage(self, tenant_id, classified, stats, elapsed):
+        items = classified or 1
+        tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+        logger.info(
+            f"Classified {classified} interactions for {tenant_id} in {stats['calls']} LLM calls: "
+            f"{classified / max(elapsed, 1e-9):.1f} items/s, {tokens / items:.0f} tokens/item, "
+            f"{classified / max(stats['calls'], 1):.1f} items/call"
+        )
+
+    async def save_results(self, session, schema, results):
+        # 5. Save results: one array-unnest upsert per SENTIMENT_FLUSH_SIZE rows
         insert_sql = text(f"""
             INSERT INTO "{schema}".sentiment_results (interaction_id, sentiment, emotion, confidence, model_version)
-            VALUES (:id, :sentiment, :emotion, :conf, :ver)
-            ON CONFLICT (interaction_id) DO NOTHING
+            SELECT t.interaction_id, t.sentiment, t.emotion, t.confidence, t.model_version
+            FROM unnest(
+                CAST(:ids AS text[]),
+                CAST(:sentiments AS text[]),
+                CAST(:emotions AS text[]),
+                CAST(:confs AS float8[]),
+                CAST(:versions AS text[])
+            ) AS t(interaction_id, sentiment, emotion, confidence, model_version)
+            ON CONFLICT (interaction_id) DO UPDATE
+            SET sentiment = EXCLUDED.sentiment,
+                emotion = EXCLUDED.emotion,
+                confidence = EXCLUDED.confidence,
+                model_version = EXCLUDED.model_version,
+                processed_at = now()
+            WHERE sentiment_results.model_version = 'unclassified'
         """)
-        
-        await session.execute(insert_sql, {
-            "id": interaction_id,
-            "sentiment": result.get("sentiment", "neutral"),
-            "emotion": result.get("emotion"),
-            "conf": result.get("confidence", 0.0),
-            "ver": settings.MODEL_NAME
-        })
+
+        items = list(results.items())
+        for i in range(0, len(items), settings.SENTIMENT_FLUSH_SIZE):
+            chunk = items[i:i + settings.SENTIMENT_FLUSH_SIZE]
+            await session.execute(insert_sql, {
+                "ids": [interaction_id for interaction_id, _ in chunk],
+                "sentiments": [r.get("sentiment", "neutral") for _, r in chunk],
+                "emotions": [r.get("emotion") for _, r in chunk],
+                "confs": [_confidence(r) for _, r in chunk],
+                "versions": [r.get("model_version", settings.MODEL_NAME) for _, r in chunk],
+            })
+
+    async def save_failures(self, session, item: WorkItem):
+        """
+        Records the page's failed interactions in sentiment_failures (one more
+        attempt, next retry after the backoff) and drops retried ones that
+        were classified this time.
+        """
+        if item.failed:
+            await session.execute(text(f"""
+                INSERT INTO "{item.schema}".sentiment_failures
+                    (interaction_id, row_id, attempts, last_error, retry_at, updated_at)
+                SELECT t.interaction_id, t.row_id, 1, t.error, now() + make_interval(secs => :base), now()
+                FROM unnest(
+                    CAST(:ids AS text[]),
+                    CAST(:row_ids AS bigint[]),
+                    CAST(:errors AS text[])
+                ) AS t(interaction_id, row_id, error)
+                ON CONFLICT (interaction_id) DO UPDATE
+                SET attempts = sentiment_failures.attempts + 1,
+                    last_error = EXCLUDED.last_error,
+                    retry_at = now() + make_interval(
+                        secs => LEAST(:base * power(2, sentiment_failures.attempts), :max_delay)
+                    ),
+                    updated_at = now()
+            """), {
+                "ids": list(item.failed),
+                "row_ids": [item.row_ids[interaction_id] for interaction_id in item.failed],
+                "errors": list(item.failed.values()),
+                "base": settings.SENTIMENT_RETRY_BASE_SECONDS,
+                "max_delay": settings.SENTIMENT_RETRY_MAX_SECONDS,
+            })
+        resolved = [interaction_id for interaction_id in item.retried if interaction_id in item.results]
+        if resolved:
+            await session.execute(text(f"""
+                DELETE FROM "{item.schema}".sentiment_failures
+                WHERE interaction_id = ANY(CAST(:ids AS text[]))
+            """), {"ids": resolved})
+
+
+def settle_horizon(
+    safe_id: int, horizon_id: int | None, horizon_xmax: int | None, high_water: int, xmin: int, xmax: int
+) -> tuple[int, int | None, int | None]:
+    """
+    Advances a tenant's safe id (see estimate_backlog). The pending horizon
+    (max id seen, snapshot xmax right after) becomes safe once the oldest
+    transaction still in progress (xmin) started after it; a new horizon is
+    then recorded at the current max id. Returns (safe_id, horizon_id, horizon_xmax).
+    """
+    if horizon_id is not None and xmin >= horizon_xmax:
+        safe_id, horizon_id, horizon_xmax = max(safe_id, horizon_id), None, None
+    if xmin == xmax:
+        # Nothing in progress: every id up to max(id) is settled already
+        return max(safe_id, high_water), None, None
+    if horizon_id is None and high_water > safe_id:
+        horizon_id, horizon_xmax = high_water, xmax
+    return safe_id, horizon_id, horizon_xmax
+
+
+def page_size_for(backlog: int) -> int:
+    # Small backlogs in one BATCH_SIZE page; large ones take bigger bites per cycle
+    return max(settings.BATCH_SIZE, min(backlog, settings.BATCH_SIZE * settings.TENANT_MAX_PAGES_PER_CYCLE))
+
+
+def tenant_weight(backlog: int) -> float:
+    # Larger backlogs get a larger, but sub-linear, share of LLM slots
+    return 1.0 + math.log2(1 + backlog / settings.BATCH_SIZE)
+
+
+def _schema(t: dict) -> str:
+    return t["tenant_id"].strip().lower()
+
+
+def _confidence(result) -> float:
+    try:
+        return float(result.get("confidence", 0.0))
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,15 @@
+import pytest
+
+from app.core.settings import settings
+from app.jobs import retry_delay
+
+
+@pytest.fixture(autouse=True)
+def backoff(monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_JOB_RETRY_BASE_SECONDS", 30.0)
+    monkeypatch.setattr(settings, "ANALYSIS_JOB_RETRY_MAX_SECONDS", 900.0)
+
+
+@pytest.mark.parametrize("attempts, delay", [(1, 30), (2, 60), (3, 120), (5, 480), (6, 900), (20, 900)])
+def test_retry_delay_doubles_up_to_the_cap(attempts, delay):
+    assert retry_delay(attempts) == delay
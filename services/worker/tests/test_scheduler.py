@@ -0,0 +1,91 @@
+import asyncio
+
+from app.core.scheduler import FairScheduler
+
+
+def test_small_tenant_is_served_before_a_large_backlog():
+    async def scenario():
+        scheduler = FairScheduler(slots=lambda: 1, per_tenant_cap=10)
+        order, gate = [], asyncio.Event()
+
+        async def job(name):
+            order.append(name)
+            await gate.wait()
+
+        big = [asyncio.create_task(scheduler.run("big", 1, 1, lambda i=i: job(f"big{i}"))) for i in range(5)]
+        await asyncio.sleep(0)
+        small = asyncio.create_task(scheduler.run("small", 1, 1, lambda: job("small")))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*big, small)
+        return order
+
+    order = asyncio.run(scenario())
+    # big0 was already running; small's first tag ties with big1 and was queued later
+    assert order.index("small") <= 2
+
+
+def test_per_tenant_cap_leaves_slots_to_others():
+    async def scenario():
+        scheduler = FairScheduler(slots=lambda: 3, per_tenant_cap=1)
+        running, peak, gate = {}, {}, asyncio.Event()
+
+        async def job(tenant):
+            running[tenant] = running.get(tenant, 0) + 1
+            peak[tenant] = max(peak.get(tenant, 0), running[tenant])
+            await gate.wait()
+            running[tenant] -= 1
+
+        tasks = [asyncio.create_task(scheduler.run(t, 1, 1, lambda t=t: job(t))) for t in ("a", "a", "a", "b")]
+        await asyncio.sleep(0)
+        stats = scheduler.stats()
+        gate.set()
+        await asyncio.gather(*tasks)
+        return peak, stats
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == {"a": 1, "b": 1}
+    assert stats == {"running": 2, "queued": 2, "tenants": 2}
+
+
+def test_idle_tenants_are_forgotten():
+    async def scenario():
+        scheduler = FairScheduler(slots=lambda: 1, per_tenant_cap=1)
+        gate = asyncio.Event()
+
+        async def job():
+            await gate.wait()
+
+        first = asyncio.create_task(scheduler.run("a", 1, 1, job))
+        queued = asyncio.create_task(scheduler.run("b", 1, 1, job))
+        await asyncio.sleep(0)
+        queued.cancel()
+        gate.set()
+        await asyncio.gather(first, queued, return_exceptions=True)
+        for i in range(10):
+            await scheduler.run(f"t{i}", 1, 1, lambda: asyncio.sleep(0))
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler._finish == {} and scheduler._pending == {} and scheduler._inflight == {}
+    assert scheduler.stats() == {"running": 0, "queued": 0, "tenants": 0}
+
+
+def test_results_and_errors_are_passed_through():
+    async def scenario():
+        scheduler = FairScheduler(slots=lambda: 2, per_tenant_cap=2)
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def ok():
+            return 42
+
+        results = await asyncio.gather(
+            scheduler.run("a", 1, 1, ok), scheduler.run("a", 1, 1, fail), return_exceptions=True
+        )
+        return results, scheduler.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results[0] == 42 and isinstance(results[1], RuntimeError)
+    assert stats["running"] == 0
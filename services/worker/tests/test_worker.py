@@ -0,0 +1,48 @@
+import pytest
+
+from app.worker import WorkItem, settle_horizon
+
+
+def _item(results=(), unavailable=()):
+    items = [("i1", "good"), ("i2", "throttled"), ("i3", "junk")]
+    return WorkItem(
+        tenant={"tenant_id": "org_a"}, schema="org_a", last_id=30, items=items,
+        row_ids={"i1": 10, "i2": 20, "i3": 30},
+        results={i: {"sentiment": "positive"} for i in results},
+        unavailable=set(unavailable),
+    )
+
+
+def test_requeue_failed_records_every_unclassified_item():
+    item = _item(results=["i1"], unavailable=["i2"])
+    assert item.requeue_failed() == 2
+    assert item.failed == {"i2": "rate limited", "i3": "no valid result"}
+
+
+def test_requeue_failed_never_stores_placeholders_or_moves_the_cursor():
+    item = _item(results=["i1"], unavailable=["i2"])
+    item.requeue_failed()
+    assert set(item.results) == {"i1"}
+    assert item.last_id == 30
+
+
+def test_requeue_failed_with_everything_classified():
+    item = _item(results=["i1", "i2", "i3"])
+    assert item.requeue_failed() == 0
+    assert item.failed == {}
+
+
+@pytest.mark.parametrize("state, snapshot, expected", [
+    # Nothing in progress: max(id) is safe at once
+    ((0, None, None, 50), (7, 7), (50, None, None)),
+    # Something in progress: max(id) becomes the pending horizon
+    ((0, None, None, 50), (7, 9), (0, 50, 9)),
+    # The horizon's transactions are still running
+    ((0, 50, 9, 60), (8, 12), (0, 50, 9)),
+    # They ended: the horizon is safe and a new one starts at max(id)
+    ((0, 50, 9, 60), (9, 12), (50, 60, 12)),
+    # Caught up: no new horizon
+    ((50, 50, 9, 50), (10, 12), (50, None, None)),
+])
+def test_settle_horizon(state, snapshot, expected):
+    assert settle_horizon(*state, *snapshot) == expected